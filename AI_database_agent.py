@@ -1,6 +1,15 @@
 import aisuite
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import automation_manager
+from models import StructuredLead
+
+# Shared client so the HTTP connection pool to the LLM provider is reused across requests
+_client = aisuite.Client()
+
+# Number of Leads fetched from the database (and sent to the client) at a time when streaming a CSV export
+CSV_CHUNK_SIZE = 1000
 
 
 tools = [
@@ -43,22 +52,44 @@ tools = [
             "description": (
                 "Used to send the user a custom CSV file as per their specifications. How to use tool:\n"
                 "If the user asks to download or export the selected Leads (maybe even with custom columns and column names), "
-                "you can use this tool to rewrite the selected Leads into a CSV file and send it directly to the user. "
-                "Make sure not to make mistakes while copying data over."
+                "you can use this tool to export the selected Leads into a CSV file and send it directly to the user. "
+                "You only describe the columns (header + source field) and which Leads to export, the rows are filled in from the database. "
+                "Valid source fields are 'id', 'created_at', 'updated_at', 'source' and any key of a Lead's 'data'."
             ),
             "strict": True,
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "csv_content": {
-                        "type": "string",
-                        "description": (
-                            "The content of the CSV file, formatted as text. Example: 'header,header2\\nvalue1,value2\\n...'"
-                        )
+                    "columns": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "header": {
+                                    "type": "string",
+                                    "description": "The column name as it should appear in the CSV header."
+                                },
+                                "field": {
+                                    "type": "string",
+                                    "description": "The Lead field the column values are taken from."
+                                }
+                            },
+                            "required": ["header", "field"],
+                            "additionalProperties": False
+                        },
+                        "description": "Ordered list of the CSV columns"
+                    },
+                    "lead_ids": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "description": "ID of a Lead to export"
+                        },
+                        "description": "List of Lead IDs to export, one row per Lead"
                     }
                 },
                 "additionalProperties": False,
-                "required": ["csv_content"]
+                "required": ["columns", "lead_ids"]
             }
         }
     },
@@ -106,28 +137,99 @@ tools = [
     # }
 ]
 
+# The model, tools and temperature never change between turns, so they are bound to the client once
+_create_completion = partial(
+    _client.chat.completions.create,
+    model="openai:gpt-4o",
+    tools=tools,
+    temperature=0
+)
+
 
 def start_rendering_and_uploading_process(list_of_leads: list[str], rerender_all: bool):
     list_of_leads = [int(l) for l in list_of_leads]
-    result = ""
+    leads = StructuredLead.query.filter(StructuredLead.id.in_(list_of_leads)).all()
+    leads_by_id = {lead.id: lead for lead in leads}
+    result = []
     for lead_id in list_of_leads:
-        
-        from models import StructuredLead
-        lead = StructuredLead.query.get(lead_id)
+        lead = leads_by_id.get(lead_id)
         if lead and lead.company_id:
-            result += str(automation_manager.start_render_and_upload_if_not_exist(company_id=lead.company_id, rerender_all=rerender_all)) + "\n"
+            result.append(str(automation_manager.start_render_and_upload_if_not_exist(company_id=lead.company_id, overwrite_conditions=rerender_all)) + "\n")
         else:
-            result += f"Lead with id {lead_id} not found or has no company assigned.\n"
-    return result
+            result.append(f"Lead with id {lead_id} not found or has no company assigned.\n")
+    return "".join(result)
 
 
-def send_csv_file(csv_content: str):
-    import secrets
-    hex_code = secrets.token_hex(16)
-    with open("output/"+hex_code+".csv", "w") as file:
-        file.write(csv_content)
-    return f"new CSV file downloadable via 'https://atomic.steamlined.solutions/output/{hex_code}.csv'"  # TODO: make the link be relative to the URL that the user is on.
-    
+def send_csv_file(columns: list[dict[str, str]], lead_ids: list[str], selected_lead_ids: set[int]):
+    """
+    Prepares a CSV export of the given Leads and returns the link to download it from.
+
+    Only the export definition is stored here, the rows are streamed from the database
+    by the `/export/<export_id>` route when the link is opened.
+
+    Args:
+    columns: [{"header": "Column name", "field": "lead field"}, ...]
+    lead_ids: IDs of the Leads to export
+    selected_lead_ids: IDs of the Leads the user selected, only these can be exported
+    """
+    import os
+    import uuid
+
+    # Checked here, the export is streamed after the response headers are sent and can't report errors anymore
+    try:
+        lead_ids = [int(l) for l in lead_ids]
+    except (TypeError, ValueError):
+        return f"Export failed, the lead ids must be the numeric IDs of the selected Leads. Got: {lead_ids}"
+    not_selected = [l for l in lead_ids if l not in selected_lead_ids]
+    if not_selected:
+        return f"Export failed, only the selected Leads can be exported. Not selected: {not_selected}"
+
+    export_id = uuid.uuid4().hex[:16]
+    path = "output/" + export_id + ".json"
+    # Written to a temporary file first and renamed once complete, so a half written definition is never read
+    with open(path + ".tmp", "w") as file:
+        json.dump({"columns": columns, "lead_ids": lead_ids}, file)
+    os.replace(path + ".tmp", path)
+    return f"new CSV file (export id {export_id}) downloadable via 'https://atomic.steamlined.solutions/export/{export_id}'"  # TODO: make the link be relative to the URL that the user is on.
+
+
+def generate_csv(columns: list[dict[str, str]], lead_ids: list[int]):
+    """
+    Yields a CSV export of the given Leads chunk by chunk.
+
+    Args:
+    columns: [{"header": "Column name", "field": "lead field"}, ...]
+    lead_ids: IDs of the Leads to export
+
+    Returns:
+    Generator of CSV text chunks, starting with the header row
+    """
+    import csv
+    import io
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+    from models import Lead, db
+
+    fields = [c["field"] for c in columns]
+    stmt = (
+        select(Lead)
+        .where(Lead.id.in_(lead_ids))
+        .options(selectinload(Lead.data))
+        .execution_options(yield_per=CSV_CHUNK_SIZE)
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([c["header"] for c in columns])
+    for partition in db.session.execute(stmt).scalars().partitions():
+        for lead in partition:
+            lead_dict = lead.to_dict()
+            values = {**lead_dict.pop("data"), **lead_dict}
+            writer.writerow([values.get(f, "") for f in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
 
 def make_edit(edits_json: dict[str, list[dict[str, str]]]):
     """
@@ -140,31 +242,26 @@ def make_edit(edits_json: dict[str, list[dict[str, str]]]):
     from models import Lead, LeadData
     from main import db
 
-    edits_json = {lead_id: [{"field": u["field"], "value": u["overwrite_value"]} for u in edits_json["updates"] if u["leadId"] == lead_id] for lead_id in {u["leadId"] for u in edits_json["updates"]}}
-    #  {"leadid": [{"field": "new value", "field2": "new value"}]}
-
-    # Process each lead's edits
-    for lead_id, edits in edits_json.items():
-        # Get the lead
-        lead = db.session.get(Lead, int(lead_id))
-        if not lead:
-            continue
-
-        # Apply each edit
-        for edit in edits:
-            field_name = edit["field"]
-            new_value = edit["value"]
-            
-            # Create new LeadData entry
-            lead_data = LeadData(
-                lead_id=lead.id,
-                field_name=field_name,
-                field_value=new_value
-            )
-            db.session.add(lead_data)
-
-    # Commit all changes
+    # Group the updates by lead in a single pass
+    edits_by_lead = {}
+    for u in edits_json["updates"]:
+        edits_by_lead.setdefault(int(u["leadId"]), []).append({"field": u["field"], "value": u["overwrite_value"]})
+    #  {leadid: [{"field": "name", "value": "new value"}, ...]}
+
+    # Only keep the leads that actually exist, looked up with one query
+    existing_lead_ids = set(db.session.scalars(db.select(Lead.id).where(Lead.id.in_(list(edits_by_lead)))))
+
+    # Overwrite the fields, the last edit of a field wins
+    rows = {
+        (lead_id, edit["field"]): {"lead_id": lead_id, "field_name": edit["field"], "field_value": edit["value"]}
+        for lead_id, edits in edits_by_lead.items() if lead_id in existing_lead_ids
+        for edit in edits
+    }
+
+    # Upsert all entries with one statement and commit
     try:
+        if rows:
+            LeadData.upsert(list(rows.values()))
         db.session.commit()
         return 'Successfully updated leads'
     except Exception as e:
@@ -172,6 +269,41 @@ def make_edit(edits_json: dict[str, list[dict[str, str]]]):
         return f'Error updating leads: {str(e)}'
 
 
+# (version key, rendered string), the key is re-checked on every call so edits from other processes show up
+_exporting_templates_cache = None
+
+
+def get_exporting_templates_string() -> str:
+    """
+    Returns the export templates rendered for the system prompt.
+
+    The rendered string is cached per (count, max id, max updated_at) of the templates, which one cheap
+    aggregate query checks before the string is reused, so templates changed by another process are picked up.
+    """
+    global _exporting_templates_cache
+    from sqlalchemy import func, select
+    from models import ExportTemplate, db
+    version = tuple(db.session.execute(
+        select(func.count(ExportTemplate.id), func.max(ExportTemplate.id), func.max(ExportTemplate.updated_at))
+    ).one())
+    cached = _exporting_templates_cache
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    templates = db.session.execute(
+        select(ExportTemplate).execution_options(stream_results=True, yield_per=200)
+    ).scalars()
+    rendered = "".join(f"Template {t.id} ({t.name}): {t.get_columns()}\n" for t in templates)
+    _exporting_templates_cache = (version, rendered)
+    return rendered
+
+
+def invalidate_exporting_templates_cache():
+    """Drops the cached export templates string, call after creating/editing/deleting a template."""
+    global _exporting_templates_cache
+    _exporting_templates_cache = None
+
+
 tool_call_dict = {
     "start_rendering_and_uploading_process": start_rendering_and_uploading_process,
     "send_csv_file": send_csv_file,
@@ -180,22 +312,32 @@ tool_call_dict = {
 
 
 
-def respond(messages: list, selected_leads:list, depth=0):
-    if depth > 2:
-        return messages
+def run_tool_call(app, call, selected_lead_ids: set[int]) -> str:
+    """Runs one tool call from the LLM inside its own application context and returns the result as a string."""
+    with app.app_context():
+        args = json.loads(call.function.arguments)
+        function = tool_call_dict[call.function.name]
+        if function is send_csv_file:
+            args["selected_lead_ids"] = selected_lead_ids
+        return str(function(**args))
 
+
+def respond(messages: list, selected_leads:list, max_depth=3):
+    from flask import current_app
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
     from models import Lead
     from main import db
-    selected_leads_string = ""
-    for lead_id in selected_leads:
-        lead = db.session.get(Lead, int(lead_id))
-        if lead:
-            selected_leads_string += str(lead.to_dict()) + "\n"
-    
-    from models import ExportTemplate
-    exporting_templates_string = ""
-    for t in ExportTemplate.query.all():
-        exporting_templates_string += f"Template {t.id} ({t.name}): {t.get_columns()}\n"
+    selected_lead_ids = {int(l) for l in selected_leads}
+    leads = db.session.execute(
+        select(Lead)
+        .where(Lead.id.in_(selected_lead_ids))
+        .options(selectinload(Lead.data))
+        .execution_options(stream_results=True, yield_per=200)
+    ).scalars()
+    selected_leads_string = "".join(str(lead.to_dict()) + "\n" for lead in leads)
+
+    exporting_templates_string = get_exporting_templates_string()
 
     prompt = f"""You are a AI Agent that the user talks to to manage their database of Leads and maybe other datatypes.
     You have many tools and intelligently use them to do the users requests.
@@ -215,30 +357,26 @@ def respond(messages: list, selected_leads:list, depth=0):
     ```
 
 """
-    
-    response = aisuite.Client().chat.completions.create(
-        model="openai:gpt-4o", 
-        messages=[{"role": "system", "content": prompt}] + messages, 
-        tools=tools,
-        temperature=0
-    )
-    messages.append(response.choices[0].message)
-    if response.choices[0].message.tool_calls:
+    app = current_app._get_current_object()
 
-        for call in response.choices[0].message.tool_calls:
-            args = json.loads(call.function.arguments)
-        
-            function = tool_call_dict[call.function.name]
+    # Each round the LLM can call tools, their results are sent back in the next round
+    for depth in range(max_depth):
+        response = _create_completion(messages=[{"role": "system", "content": prompt}] + messages)
+        message = response.choices[0].message
+        messages.append(message.model_dump())
+        if not message.tool_calls:
+            break
 
-            tool_call_result = function(**args)
+        # Tool calls are independent and mostly wait on the DB/Drive, so run them concurrently
+        with ThreadPoolExecutor(max_workers=len(message.tool_calls)) as executor:
+            results = list(executor.map(lambda call: run_tool_call(app, call, selected_lead_ids), message.tool_calls))
+        for call, tool_call_result in zip(message.tool_calls, results):
             messages.append({
                 "role": "tool",
                 "tool_call_id": call.id,
-                "content": str(tool_call_result)
+                "content": tool_call_result
             })
-        messages = respond(messages=messages, selected_leads=selected_leads, depth=depth+1)
     
-    messages = [json.loads(m.model_dump_json()) if not isinstance(m, dict) else m for m in messages]
     return messages
 
 if __name__ == "__main__":
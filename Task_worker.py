@@ -1,6 +1,9 @@
 import uuid
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timedelta
 from typing import Dict, Union
 
@@ -8,19 +11,34 @@ import config
 import utils.render as render
 import utils.browser_tools as browser_tools
 from main import app, db
-from models import ProcessingTask, Company, get_session
+from models import ProcessingTask, Company, CategoryCache, get_session, upsert_insert
+from sqlalchemy import select, update
 from sqlalchemy.sql import case
 from utils.types import VideoConfig
 from drive_oauth import upload_file_to_drive
+from utils.ai_basic_functions import categorize
 
+# Polling interval bounds (seconds) while the queue is empty. The interval starts small
+# so newly created tasks are picked up quickly and doubles up to the maximum while idle.
+# The maximum stays low so the first task after an idle period still starts within a few
+# seconds, the poll is a single indexed lookup on the open tasks.
+MIN_POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 5
 
-def get_next_task(session, instance_id: str) -> Union[ProcessingTask, None]:
+# Number of worker threads per task type. Renders are CPU bound, uploads are network bound,
+# so they run in separate workers and neither waits for the other.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 1))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 1))
+
+
+def get_next_task(session, instance_id: str, task_types: list[str] = None) -> Union[ProcessingTask, None]:
     """
     Gets the next video task to process and marks it as in progress.
     
     Args:
         session (Session): The SQLAlchemy session to use.
         instance_id (str): The ID of the current processing instance
+        task_types (list[str], optional): Only consider tasks of these types. All types if None.
     
     Returns:
         Union[ProcessingTask, None]: The next task to process, or None if no tasks are available
@@ -36,24 +54,30 @@ def get_next_task(session, instance_id: str) -> Union[ProcessingTask, None]:
     )
 
     try:
-        # Use FOR UPDATE to lock the row while we're processing it
-        next_task = (
-            session.query(ProcessingTask)
-            .filter(
-                (ProcessingTask.status == 'pending')
-                | ((ProcessingTask.status == 'in_progress') & (ProcessingTask.updated_at < stuck_timeout))
-            )
+        query = select(ProcessingTask.id).where(
+            (ProcessingTask.status == 'pending')
+            | ((ProcessingTask.status == 'in_progress') & (ProcessingTask.updated_at < stuck_timeout))
+        )
+        if task_types is not None:
+            query = query.where(ProcessingTask.task_type.in_(task_types))
+        next_task_id = (
+            query
             .order_by(ordering)
+            .limit(1)
             .with_for_update(skip_locked=True)  # Skip locked rows to avoid waiting
-            .first()
+            .scalar_subquery()
         )
 
-        if next_task:
-            next_task.status = 'in_progress'
-            next_task.instance_id = instance_id
-            next_task.updated_at = datetime.utcnow()
-            session.commit()
-            
+        # Claim the task in a single UPDATE ... RETURNING, so no row lock is held while Python code runs
+        next_task = session.scalars(
+            update(ProcessingTask)
+            .where(ProcessingTask.id == next_task_id)
+            .values(status='in_progress', instance_id=instance_id, updated_at=datetime.utcnow())
+            .returning(ProcessingTask)
+            .execution_options(synchronize_session=False)
+        ).one_or_none()
+        session.commit()
+
         return next_task
     except Exception as e:
         # If any exception occurs during task acquisition, rollback and return None
@@ -62,6 +86,40 @@ def get_next_task(session, instance_id: str) -> Union[ProcessingTask, None]:
         return None
 
 
+@lru_cache(maxsize=1024)
+def get_niche_category(niche_category: str) -> str:
+    """
+    Returns the video config category ("skills program" or "money coaching") for a niche.
+
+    Looks in the in-process cache first, then in the CategoryCache table, and only asks the LLM on a miss.
+    New results are stored right away in their own transaction, so the lru_cache only holds stored rows.
+
+    Args:
+        niche_category (str): The company's niche.
+
+    Returns:
+        str: The category.
+    """
+    cached = db.session.get(CategoryCache, niche_category)
+    if cached:
+        return cached.category
+
+    category = categorize(niche_category, ["skills program", "money coaching"], "blue collar and bootcamps and trade/vocational schools are usually 'skills program'", "openai:gpt-4o-mini")
+    if category is None:
+        # Raising keeps the failed lookup out of the lru_cache
+        raise ValueError(f"Could not categorize niche '{niche_category}'")
+
+    # Own connection and transaction, so the row doesn't depend on (or roll back with) the task's commit.
+    # Workers categorizing the same new niche at once don't conflict, the first stored row wins for all of them.
+    with db.engine.begin() as connection:
+        connection.execute(
+            upsert_insert(CategoryCache)
+            .values(niche_category=niche_category, category=category)
+            .on_conflict_do_nothing(index_elements=[CategoryCache.niche_category])
+        )
+        return connection.scalar(select(CategoryCache.category).where(CategoryCache.niche_category == niche_category))
+
+
 def process_upload_video_task(session, task: ProcessingTask, instance_id: str) -> None:
     """
     Processes a video upload task.
@@ -72,9 +130,7 @@ def process_upload_video_task(session, task: ProcessingTask, instance_id: str) -
         instance_id (str): The ID of the processing instance.
     """
     try:
-        task.status = 'in_progress'
-        session.commit()
-
+        # get_next_task already marked the task 'in_progress' and holds it for this instance
         task_data = task.get_result_data()
         video_path = task_data.get('rendered_file')
 
@@ -113,17 +169,10 @@ def process_upload_video_task(session, task: ProcessingTask, instance_id: str) -
         # Format as "Month Year"
         formatted_date = dt.strftime("%B %Y")
 
-        # Re-fetch the task to make sure it's still valid
-        session.refresh(task)
-
         # Actually upload to Drive
         drive_link = upload_file_to_drive(video_path, f"{company.name} | Atomic Enrollment | {formatted_date}")  
-        # store the link in the company:
+        # store the link in the company and complete the task in one transaction
         company.custom_youtube_video = drive_link
-        session.commit()
-
-        # Re-fetch task once more before final update
-        session.refresh(task)
         task.set_result_data({'drive_link': drive_link})
         task.status = 'completed'
         session.commit()
@@ -178,34 +227,30 @@ def process_video_task(session, task: ProcessingTask, instance_id: str) -> None:
         website_screenshot_path = f"temp/website_screenshot_{instance_id}.png"
         ads_screenshot_path = f"temp/ads_screenshot_{instance_id}.png"
 
-        r = browser_tools.get_screenshot(website_url, website_screenshot_path)
+        # Both captures mostly wait on the network, so take them concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            website_future = executor.submit(browser_tools.get_screenshot, website_url, website_screenshot_path)
+            ads_future = executor.submit(browser_tools.get_screenshot, ads_url, ads_screenshot_path) if ads_url else None
+            r = website_future.result()
+            if ads_future:
+                ads_future.result()
         if r["success"] == False:
             task.status = "failed"
             task.set_result_data({"error": "Error when taking screenshot. The website likely blocked us or the image is unusable for the video"})
             session.commit()
             return
-        if ads_url:
-            browser_tools.get_screenshot(ads_url, ads_screenshot_path)
 
-        from utils.ai_basic_functions import categorize
         # 2) Render video
         # TODO better info parsing and config category detection
         config_setting_name = (
-            categorize(niche_category, ["skills program", "money coaching"], "blue collar and bootcamps and trade/vocational schools are usually 'skills program'", "openai:gpt-4o-mini")
+            get_niche_category(niche_category)
             + (" yes ads" if True else " no ads")
         )
-        video_config = config.all_configs[config_setting_name].copy()
-
-        for instruction in video_config["instructions"]:
-            if "image_path" in instruction:
-                instruction["image_path"] = instruction["image_path"].format(instance_id)
+        video_config = config.config_for_instance(config_setting_name, instance_id)
 
         output_filename = f"output/video_task_{task.id}.mp4"
         render.render_video(video_config, output_filename)
 
-        # Re-fetch the task to make sure it's still valid and hasn't been modified
-        session.refresh(task)
-        
         # 3) Mark the render task 'completed'
         task.status = 'completed'
         task.set_result_data({
@@ -213,9 +258,8 @@ def process_video_task(session, task: ProcessingTask, instance_id: str) -> None:
             'config_used': config_setting_name
         })
         task.updated_at = datetime.utcnow()
-        session.commit()
 
-        # 4) Create a new 'upload_video' task
+        # 4) Create a new 'upload_video' task, committed together with the completed render task
         new_task = ProcessingTask(
             company_id=task.company_id,
             task_type='upload_video',
@@ -238,63 +282,90 @@ def process_video_task(session, task: ProcessingTask, instance_id: str) -> None:
         raise  # Re-raise the exception for the main loop to handle
 
 
-def main() -> None:
+def run_worker(task_types: list[str]) -> None:
     """
-    Main function for the video renderer.
+    Worker loop that processes tasks of the given types.
 
-    This function continuously checks for pending or stuck video tasks and processes them.
+    This function continuously checks for pending or stuck tasks of `task_types` and processes them.
     It runs in an infinite loop until manually stopped.
+
+    Args:
+        task_types (list[str]): The task types this worker picks up.
     """
     instance_id = str(uuid.uuid4())
-    print(f"Starting video renderer instance {instance_id}")
-
-    while True:
-        # Use an application context to ensure access to Flask's config and DB
-        with app.app_context():
-            # Get a session for fetching and processing tasks
-            with get_session() as session:
-                next_task = get_next_task(session, instance_id)
-
-                if next_task:
+    print(f"Starting {', '.join(task_types)} worker instance {instance_id}")
+
+    poll_interval = MIN_POLL_INTERVAL
+
+    # Keep one application context and session (and with it a pooled connection) for the whole loop
+    with app.app_context(), get_session() as session:
+        while True:
+            # Expire cached objects so every iteration reads fresh rows
+            session.expire_all()
+            next_task = get_next_task(session, instance_id, task_types)
+
+            if next_task:
+                poll_interval = MIN_POLL_INTERVAL
+                try:
+                    # Re-fetch task in case the object is stale
+                    next_task = session.query(ProcessingTask).get(next_task.id)
+                    if not next_task:
+                        print("Task not found or already processed by another worker.")
+                        continue
+
+                    if next_task.task_type == 'video_render':
+                        process_video_task(session, next_task, instance_id)
+                    elif next_task.task_type == 'upload_video':
+                        process_upload_video_task(session, next_task, instance_id)
+                    else:
+                        print(f"Unknown task type: {next_task.task_type}")
+                        next_task.status = 'failed'
+                        session.commit()
+
+                except Exception as e:
+                    print(f"Unexpected error processing task {next_task.id if next_task else 'unknown'}: {e}")
+                    # First roll back the session to recover from any previous errors
+                    session.rollback()
+                    
                     try:
-                        # Re-fetch task in case the object is stale
-                        next_task = session.query(ProcessingTask).get(next_task.id)
-                        if not next_task:
-                            print("Task not found or already processed by another worker.")
-                            continue
-
-                        if next_task.task_type == 'video_render':
-                            process_video_task(session, next_task, instance_id)
-                        elif next_task.task_type == 'upload_video':
-                            process_upload_video_task(session, next_task, instance_id)
-                        else:
-                            print(f"Unknown task type: {next_task.task_type}")
-                            next_task.status = 'failed'
-                            session.commit()
-
-                    except Exception as e:
-                        print(f"Unexpected error processing task {next_task.id if next_task else 'unknown'}: {e}")
-                        # First roll back the session to recover from any previous errors
+                        # Re-fetch the task after rollback
+                        if next_task and next_task.id:
+                            next_task = session.query(ProcessingTask).get(next_task.id)
+                            if next_task:
+                                # Mark task as failed
+                                next_task.status = 'failed'
+                                next_task.set_result_data({'error': str(e)})
+                                next_task.updated_at = datetime.utcnow()
+                                session.commit()
+                            else:
+                                print(f"Task not found after rollback, it may have been processed by another worker")
+                    except Exception as inner_e:
+                        print(f"Error updating task status after exception: {inner_e}")
                         session.rollback()
-                        
-                        try:
-                            # Re-fetch the task after rollback
-                            if next_task and next_task.id:
-                                next_task = session.query(ProcessingTask).get(next_task.id)
-                                if next_task:
-                                    # Mark task as failed
-                                    next_task.status = 'failed'
-                                    next_task.set_result_data({'error': str(e)})
-                                    next_task.updated_at = datetime.utcnow()
-                                    session.commit()
-                                else:
-                                    print(f"Task not found after rollback, it may have been processed by another worker")
-                        except Exception as inner_e:
-                            print(f"Error updating task status after exception: {inner_e}")
-                            session.rollback()
-                else:
-                    print(f"Instance {instance_id}: No pending tasks found. Waiting...")
-                    time.sleep(60)
+            else:
+                # End the read transaction so the connection goes back to the pool while idle
+                session.commit()
+                print(f"Instance {instance_id}: No pending tasks found. Waiting {poll_interval}s...")
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
+
+
+def main() -> None:
+    """
+    Main function for the video renderer.
+
+    Starts RENDER_WORKERS render workers and UPLOAD_WORKERS upload workers in separate threads,
+    so Drive uploads keep running while a video is rendering. Coordination between the workers
+    happens in the database.
+    """
+    workers = (
+        [threading.Thread(target=run_worker, args=(["video_render"],), daemon=True) for _ in range(RENDER_WORKERS)]
+        + [threading.Thread(target=run_worker, args=(["upload_video"],), daemon=True) for _ in range(UPLOAD_WORKERS)]
+    )
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
 
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, g
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from models import User
 import logging
@@ -16,9 +16,15 @@ login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Load user by ID."""
+    """Load user by ID, memoized for the lifetime of the request."""
     logger.debug(f"Loading user with ID: {user_id}")
-    return User.query.get(int(user_id))
+    if not str(user_id).isdigit():
+        logger.debug(f"Rejecting non-numeric user ID: {user_id}")
+        return None
+    cache_key = '_user_cache_' + str(user_id)
+    if cache_key not in g:
+        setattr(g, cache_key, User.query.get(int(user_id)))
+    return g.get(cache_key)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
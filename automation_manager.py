@@ -1,5 +1,6 @@
 from models import db, ProcessingTask, StructuredLead, Company
-from datetime import datetime
+from collections import defaultdict
+from sqlalchemy import update, delete
 
 def get_company_task_statuses(company_id):
     """
@@ -17,16 +18,36 @@ def get_company_task_statuses(company_id):
                   ...
               ]
     """
-    tasks: list[ProcessingTask] = ProcessingTask.query.filter_by(company_id=company_id).all()
-    task_list = []
-    for t in tasks:
-        task_list.append({
-            "task_type": t.task_type,
-            "status": t.status,
-            "updated_at": t.updated_at.isoformat() if t.updated_at else None,
-            "result_data": t.result_data
+    return get_companies_task_statuses([company_id]).get(company_id, [])
+
+def get_companies_task_statuses(company_ids):
+    """
+    Retrieve all video-related tasks for many companies at once with a single query.
+
+    Args:
+        company_ids (list[int]): The IDs of the companies.
+
+    Returns:
+        dict: Maps each company id that has tasks to a list of task dicts, in the same
+              format as `get_company_task_statuses`.
+    """
+    rows = db.session.query(
+        ProcessingTask.company_id,
+        ProcessingTask.task_type,
+        ProcessingTask.status,
+        ProcessingTask.updated_at,
+        ProcessingTask.result_data
+    ).filter(ProcessingTask.company_id.in_(company_ids))
+
+    statuses = defaultdict(list)
+    for company_id, task_type, status, updated_at, result_data in rows:
+        statuses[company_id].append({
+            "task_type": task_type,
+            "status": status,
+            "updated_at": updated_at.isoformat() if updated_at else None,
+            "result_data": result_data
         })
-    return task_list
+    return statuses
 
 def start_render_and_upload_if_not_exist(company_id, overwrite_conditions=False):
     """
@@ -44,7 +65,6 @@ def start_render_and_upload_if_not_exist(company_id, overwrite_conditions=False)
         dict: Information about the newly-created task or a message stating that no task was created.
               For example: {"status": "created", "task_id": 123} or {"status": "skipped", "reason": "..."}.
     """
-    from main import db
     company = db.session.get(Company, int(company_id))
     if not company:
         return {"status": "error", "reason": f"Company with id={company_id} not found."}
@@ -55,30 +75,39 @@ def start_render_and_upload_if_not_exist(company_id, overwrite_conditions=False)
             "reason": "Company has a custom YouTube video and overwrite_conditions is False."
         }
     
-    # Grab existing tasks
-    existing_tasks = ProcessingTask.query.filter_by(company_id=company_id).all()
+    # Only the type and status of the existing video tasks are needed
+    existing_tasks = db.session.query(ProcessingTask.task_type, ProcessingTask.status).filter(
+        ProcessingTask.company_id == company_id,
+        ProcessingTask.task_type.in_(("video_render", "upload_video"))
+    ).all()
     
     # Check for a video_render or upload_video task that's not failed.
     # We might consider 'failed' a possible re-start condition if desired.
     # If you consider 'failed' tasks as a reason to re-render, adjust logic accordingly.
     relevant_task_found = False
-    for t in existing_tasks:
-        if t.task_type in ("video_render", "upload_video") and t.status in ("pending", "in_progress", "completed"):
+    video_render_success = False
+    upload_failed = False
+    for task_type, status in existing_tasks:
+        if status in ("pending", "in_progress", "completed"):
             relevant_task_found = True
-            break
+        if task_type == "video_render" and status == "completed":
+            video_render_success = True
+        elif task_type == "upload_video" and status == "failed":
+            upload_failed = True
 
     if relevant_task_found and not overwrite_conditions:
-        # Check if video_render was successful but upload_video failed
-        video_render_success = False
-        upload_failed = False
-        for t in existing_tasks:
-            if t.task_type == "video_render" and t.status == "completed":
-                video_render_success = True
-            elif t.task_type == "upload_video" and t.status == "failed":
-                upload_failed = True
-                t.status = "pending"  # Reset failed upload task to pending
-                t.updated_at = datetime.utcnow()
-                db.session.commit()
+        if upload_failed:
+            # Reset failed upload tasks to pending
+            db.session.execute(
+                update(ProcessingTask)
+                .where(
+                    ProcessingTask.company_id == company_id,
+                    ProcessingTask.task_type == "upload_video",
+                    ProcessingTask.status == "failed"
+                )
+                .values(status="pending")
+            )
+            db.session.commit()
 
         if video_render_success and upload_failed:
             return {
@@ -95,9 +124,7 @@ def start_render_and_upload_if_not_exist(company_id, overwrite_conditions=False)
     new_task = ProcessingTask(
         company_id=company_id,
         task_type='video_render',
-        status='pending',
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow()
+        status='pending'
     )
     db.session.add(new_task)
     db.session.commit()
@@ -107,6 +134,70 @@ def start_render_and_upload_if_not_exist(company_id, overwrite_conditions=False)
         "task_id": new_task.id
     }
 
+def start_render_and_upload_for_companies(company_ids):
+    """
+    Bulk version of `start_render_and_upload_if_not_exist` (without overwrite_conditions) for many companies.
+    Existing tasks of all companies are loaded with one query, failed uploads are reset with one UPDATE
+    and the new 'video_render' tasks are added together.
+
+    The changes are only added to the session, the caller is responsible for committing them.
+
+    Args:
+        company_ids (list[int]): The IDs of the companies for which we want to render a video.
+
+    Returns:
+        int: The number of 'video_render' tasks created.
+    """
+    company_ids = list(dict.fromkeys(int(company_id) for company_id in company_ids))
+    if not company_ids:
+        return 0
+
+    # Companies that don't exist or already have a custom video are skipped
+    candidate_ids = {
+        company_id
+        for company_id, custom_youtube_video in db.session.query(Company.id, Company.custom_youtube_video)
+        .filter(Company.id.in_(company_ids))
+        if not (custom_youtube_video and "http" in custom_youtube_video)
+    }
+
+    relevant_task_found = set()
+    upload_failed = set()
+    for company_id, task_type, status in db.session.query(
+        ProcessingTask.company_id, ProcessingTask.task_type, ProcessingTask.status
+    ).filter(
+        ProcessingTask.company_id.in_(candidate_ids),
+        ProcessingTask.task_type.in_(("video_render", "upload_video"))
+    ):
+        if status in ("pending", "in_progress", "completed"):
+            relevant_task_found.add(company_id)
+        if task_type == "upload_video" and status == "failed":
+            upload_failed.add(company_id)
+
+    # Reset failed upload tasks to pending for companies that already have a render/upload task
+    reset_ids = upload_failed & relevant_task_found
+    if reset_ids:
+        db.session.execute(
+            update(ProcessingTask)
+            .where(
+                ProcessingTask.company_id.in_(reset_ids),
+                ProcessingTask.task_type == "upload_video",
+                ProcessingTask.status == "failed"
+            )
+            .values(status="pending")
+        )
+
+    new_tasks = [
+        ProcessingTask(
+            company_id=company_id,
+            task_type='video_render',
+            status='pending'
+        )
+        for company_id in company_ids
+        if company_id in candidate_ids and company_id not in relevant_task_found
+    ]
+    db.session.add_all(new_tasks)
+    return len(new_tasks)
+
 def clear_company_tasks(company_id):
     """
     Deletes all tasks associated with a given company.
@@ -119,14 +210,11 @@ def clear_company_tasks(company_id):
               For example: {"status": "success", "message": "All tasks for company {company_id} have been deleted."}
               or {"status": "error", "message": "Company with id {company_id} not found."}
     """
-    from main import db
     company = db.session.get(Company, int(company_id))
     if not company:
         return {"status": "error", "message": f"Company with id {company_id} not found."}
 
-    tasks = ProcessingTask.query.filter_by(company_id=company_id).all()
-    for task in tasks:
-        db.session.delete(task)
+    db.session.execute(delete(ProcessingTask).where(ProcessingTask.company_id == int(company_id)))
     db.session.commit()
     return {"status": "success", "message": f"All tasks for company {company_id} have been deleted."}
 
@@ -138,10 +226,10 @@ if __name__ == "__main__":
         from models import Company
 
         if "y" in input("get list of task info? (y/n)").lower():
-            companies = Company.query.all()
-            for company in companies:
-                result = get_company_task_statuses(company.id)
-                print(f"Company {company.id}: " + str(result))
+            company_ids = [company_id for (company_id,) in db.session.query(Company.id)]
+            statuses = get_companies_task_statuses(company_ids)
+            for company_id in company_ids:
+                print(f"Company {company_id}: " + str(statuses.get(company_id, [])))
         
         if "y" in input("create video_render tasks for all companies without one? (y/n)").lower():
             companies = Company.query.all()
@@ -156,29 +244,24 @@ if __name__ == "__main__":
             print(f"Processes turned on: {total}")
 
         if "y" in input("reset failed tasks as pending?").lower():
-            from models import ProcessingTask
-            from datetime import datetime
-            failed_tasks = ProcessingTask.query.filter_by(status='failed').all()
-            for task in failed_tasks:
-                task.status = 'pending'
-                task.updated_at = datetime.utcnow()
+            reset_count = db.session.execute(
+                update(ProcessingTask)
+                .where(ProcessingTask.status == 'failed')
+                .values(status='pending')
+            ).rowcount
             db.session.commit()
-            print(f"Reset {len(failed_tasks)} failed tasks to pending.")
+            print(f"Reset {reset_count} failed tasks to pending.")
 
         if "y" in input("reset in_progress tasks as pending?").lower():
-            from models import ProcessingTask
-            from datetime import datetime
-            failed_tasks = ProcessingTask.query.filter_by(status='in_progress').all()
-            for task in failed_tasks:
-                task.status = 'pending'
-                task.updated_at = datetime.utcnow()
+            reset_count = db.session.execute(
+                update(ProcessingTask)
+                .where(ProcessingTask.status == 'in_progress')
+                .values(status='pending')
+            ).rowcount
             db.session.commit()
-            print(f"Reset {len(failed_tasks)} failed tasks to pending.")
+            print(f"Reset {reset_count} failed tasks to pending.")
         
         if "y" in input("delete all tasks?").lower():
-            from models import ProcessingTask
-            tasks = ProcessingTask.query.all()
-            for task in tasks:
-                db.session.delete(task)
+            deleted_count = db.session.execute(delete(ProcessingTask)).rowcount
             db.session.commit()
-            print(f"Deleted {len(tasks)} tasks.")
+            print(f"Deleted {deleted_count} tasks.")
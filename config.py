@@ -11,8 +11,20 @@ Default setting:
 
 The default setting is "skills program yes ads".
 """
+import os
+from types import MappingProxyType
 
-all_configs = {
+
+def _freeze(value):
+    """Recursively turns dicts into read-only mappings and lists into tuples, so the shared configs can't be mutated."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+all_configs = _freeze({
     "skills program yes ads": {
         "instructions": [
             {
@@ -106,6 +118,34 @@ all_configs = {
         ],
         "resolution": (1920, 1080)
     }
-}
+})
 
 default_setting = "skills program yes ads"
+
+# Encoder settings passed to ffmpeg when writing the final video.
+# Set RENDER_CODEC=h264_nvenc (NVIDIA) or h264_vaapi on machines with a GPU encoder to move
+# encoding off the CPU; libx264 is the portable default.
+render_codec = os.getenv("RENDER_CODEC", "libx264")
+render_threads = int(os.getenv("RENDER_THREADS", 1))
+
+
+def config_for_instance(config_name: str, instance_id: str) -> dict:
+    """
+    Returns a copy of a video config with the screenshot paths filled in for the given instance.
+
+    Args:
+        config_name (str): Key of the config in `all_configs`.
+        instance_id (str): ID of the processing instance whose screenshots are used.
+
+    Returns:
+        dict: The config, safe to use while other instances render with the same config.
+    """
+    video_config = all_configs[config_name]
+    return {
+        **video_config,
+        "instructions": [
+            {**instruction, "image_path": instruction["image_path"].format(instance_id)}
+            if "image_path" in instruction else instruction
+            for instruction in video_config["instructions"]
+        ]
+    }
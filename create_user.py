@@ -1,5 +1,6 @@
 from models import create_user, init_db
 from flask import Flask
+from sqlalchemy.pool import NullPool
 import sys
 
 def create_initial_user(username, email, password, role):
@@ -8,6 +9,8 @@ def create_initial_user(username, email, password, role):
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # One-off script against a single-writer SQLite file, so don't keep pooled connections around
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': NullPool}
     
     # Initialize the database
     init_db(app)
@@ -1,41 +1,230 @@
 import time
 from utils.csv_tools import get_field_definitions
-from models import db, StructuredLead, Company, ProcessingTask
-from urllib.parse import urlparse
+from models import db, utc_now, StructuredLead, Company, ProcessingTask, ImportBatchCounter, LeadTag, upsert_insert
 from datetime import datetime
 from typing import List, Dict, Optional, Any, Tuple
-from utils.csv_tools import ai_map_columns, csv_to_json_list
-from sqlalchemy import func
-from automation_manager import start_render_and_upload_if_not_exist
+from utils.csv_tools import ai_map_columns, csv_to_json_iter
+from utils.db_tools import count_queries
+from utils.ai_prompts import create_prompt_for_csv_check_instructions, create_prompt_for_csv_check
+from utils.ai_basic_functions import run_prompt_with_gemini_cached_async
+from sqlalchemy import func, or_, select, tuple_
+from automation_manager import start_render_and_upload_for_companies
 import logging
 import asyncio
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
 
-def normalize_url(url: str | None) -> str | None:
+# Maximum number of CSV rows sent to the AI at the same time, to stay within the provider's rate limits
+AI_CONCURRENCY = 16
+
+# Number of finished rows written to the database together
+INSERT_BATCH_SIZE = 100
+
+# Number of CSV rows read ahead of the AI workers
+ROW_QUEUE_SIZE = 64
+
+# Seconds to wait for the AI pre-check of an uploaded CSV before importing it unchecked
+CSV_CHECK_TIMEOUT = 120
+
+async def create_company_and_lead_async(row: Dict[str, str]) -> Tuple[Company, StructuredLead]:
     """
-    Normalizes a URL to increase matching accuracy.
-    Removes 'www.', 'http://', 'https://' and trailing slashes.
-    Returns None if url is None.
-    
-    Example:
-        'https://www.example.com/' -> 'example.com'
+    Creates the Company and StructuredLead of a CSV row with the AI, both at the same time.
+
+    Args:
+        row: The CSV row
+
+    Returns:
+        Tuple[Company, StructuredLead]: The (unsaved) company and lead
     """
-    if url is None:
-        return None
-    
+    return await asyncio.gather(
+        Company.create_with_ai_async(str(row)),
+        StructuredLead.create_using_ai_async(str(row))
+    )
+
+def add_all_or_each(objects: list) -> list:
+    """
+    Adds the objects to the session in a single flush, which SQLAlchemy sends as one multi-row INSERT.
+    If that fails, the objects are added one by one so only the failing ones are dropped.
+
+    Args:
+        objects: New model instances
+
+    Returns:
+        list: The objects that were saved
+    """
+    # One timestamp for the whole batch instead of a utc_now() default call per row and column
+    now = utc_now()
+    for obj in objects:
+        for column in ('created_at', 'updated_at'):
+            if hasattr(obj, column) and getattr(obj, column) is None:
+                setattr(obj, column, now)
+
     try:
-        # Parse the URL
-        parsed = urlparse(url)
-        # Get the netloc (domain) and remove 'www.'
-        domain = parsed.netloc.replace('www.', '')
-        # Remove trailing dots and convert to lowercase
-        domain = domain.rstrip('.').lower()
-        return domain
-    except Exception:
-        # If URL parsing fails, return the original URL
-        return url
+        # Savepoint, so a failing batch doesn't roll back the rest of the import
+        with db.session.begin_nested():
+            db.session.add_all(objects)  # Flushed on exit to get the IDs
+        return objects
+    except Exception as e:
+        logger.error(f"Bulk insert of {len(objects)} objects failed, retrying one by one. Exception: {e}", exc_info=True)
+
+    saved = []
+    for obj in objects:
+        try:
+            with db.session.begin_nested():
+                db.session.add(obj)
+            saved.append(obj)
+        except Exception as e:
+            logger.error(f"Error flushing session for: {obj.dict()}. Exception: {e}", exc_info=True)
+    return saved
+
+async def save_import_batch_async(batch: List[Tuple[Dict[str, str], Company, StructuredLead]], batch_tag: str, company_ids_by_url: Dict[str, int], seen_leads: set) -> Tuple[List[int], int]:
+    """
+    Writes a batch of AI-created companies and leads to the database with bulk INSERTs.
+    Duplicates are looked up with one query per batch instead of one per row: companies by exact or
+    normalized website URL, leads by email or first + last name. Companies whose base URL matches another
+    company are checked with Company.look_for_duplicate_async, which has Gemini confirm the match.
+
+    Args:
+        batch: (row, company, structured_lead) tuples
+        batch_tag: Tag of this import
+        company_ids_by_url: Website URL or URL match key -> company ID of companies seen in this import, updated in place
+        seen_leads: Lowercased emails and (first name, last name) pairs of leads seen in this import, updated in place
+
+    Returns:
+        Tuple[List[int], int]: Company IDs of the processed rows and the number of duplicate leads skipped
+    """
+    # Existing companies matching by exact or normalized URL (see Company.look_for_duplicate), lowest ID wins
+    match_keys = {
+        company.website_url: Company.url_match_keys(company.website_url)
+        for _, company, _ in batch if company.website_url
+    }
+    lookup_keys = set().union(*match_keys.values()) - company_ids_by_url.keys() if match_keys else set()
+    if lookup_keys:
+        for website_url, normalized, company_id in db.session.execute(
+            select(Company.website_url, Company.normalized_url, Company.id)
+            .where(or_(Company.website_url.in_(lookup_keys), Company.normalized_url.in_(lookup_keys)))
+            .order_by(Company.id.desc())
+        ):
+            company_ids_by_url[website_url] = company_id
+            company_ids_by_url[normalized] = company_id
+
+    # Key per row, the website URL or the row position for companies without one
+    company_keys = []
+    new_companies = {}
+    new_company_keys = {}
+    for position, (row, company, _) in enumerate(batch):
+        company.tags = batch_tag
+        if not company.website_url:
+            company_keys.append(position)
+            new_companies[position] = company
+            continue
+        key = company.website_url
+        company_keys.append(key)
+        if key in company_ids_by_url or key in new_companies:
+            continue
+        keys = match_keys[key]
+        # Handle potential duplicates, prefer existing company
+        existing_id = next((company_ids_by_url[k] for k in keys if k in company_ids_by_url), None)
+        if existing_id is not None:
+            # TODO: maybe merge the company infos
+            company_ids_by_url[key] = existing_id
+            continue
+        # Or a company earlier in this batch
+        duplicate_key = next((new_company_keys[k] for k in keys if k in new_company_keys), None)
+        if duplicate_key is not None:
+            company_keys[-1] = duplicate_key
+            continue
+        new_companies[key] = company
+        new_company_keys.update(dict.fromkeys(keys, key))
+
+    # Companies whose base URL (e.g. 'example.com' for 'https://example.com/page') is the whole URL of an existing
+    # or new company are only possible duplicates, distinct companies often share a host (facebook.com/..., linktr.ee/...)
+    base_keys = {}
+    for key, company in new_companies.items():
+        if isinstance(key, str):
+            base_url = Company.base_website_url(key)
+            base_key = Company.normalize_website_url(base_url)
+            if len(base_url) >= 3 and base_key != company.normalized_url:
+                base_keys[key] = base_key
+    candidate_base_keys = {company.normalized_url for company in new_companies.values()}
+    if base_keys:
+        candidate_base_keys.update(db.session.scalars(
+            select(Company.normalized_url).where(Company.normalized_url.in_(set(base_keys.values())))
+        ))
+    possible_duplicates = {
+        key: new_companies.pop(key) for key, base_key in base_keys.items() if base_key in candidate_base_keys
+    }
+
+    saved_companies = set(add_all_or_each(list(new_companies.values())))
+    batch_company_ids = {
+        key: company.id for key, company in new_companies.items() if company in saved_companies
+    }
+
+    # Checked after the other new companies are saved, so they are candidates too. Gemini is asked for all at once.
+    duplicates = await asyncio.gather(
+        *(company.look_for_duplicate_async() for company in possible_duplicates.values()), return_exceptions=True
+    )
+    for (key, company), duplicate in zip(possible_duplicates.items(), duplicates):
+        if isinstance(duplicate, Exception):
+            logger.error(f"Duplicate check failed for company: {company.website_url}, saving it as new. Exception: {duplicate}")
+            duplicate = None
+        if duplicate is not None:
+            # TODO: maybe merge the company infos
+            batch_company_ids[key] = duplicate.id
+        elif add_all_or_each([company]):
+            batch_company_ids[key] = company.id
+
+    for key, company_id in batch_company_ids.items():
+        if isinstance(key, str):
+            company_ids_by_url.update(dict.fromkeys(match_keys[key], company_id))
+
+    # Leads matching an existing lead by email or by first + last name
+    leads = [structured_lead for _, _, structured_lead in batch]
+    emails = {lead.email.lower() for lead in leads if lead.email}
+    names = {(lead.first_name.lower(), lead.last_name.lower()) for lead in leads if lead.first_name and lead.last_name}
+    existing_leads = set()
+    if emails:
+        existing_leads.update(db.session.scalars(
+            select(func.lower(StructuredLead.email)).where(func.lower(StructuredLead.email).in_(emails))
+        ))
+    if names:
+        existing_leads.update(tuple(name) for name in db.session.execute(
+            select(func.lower(StructuredLead.first_name), func.lower(StructuredLead.last_name))
+            .where(
+                # SQLite can't use ix_lead_name_lower for the row value IN, the first name IN narrows the rows through it
+                func.lower(StructuredLead.first_name).in_({first_name for first_name, _ in names}),
+                tuple_(func.lower(StructuredLead.first_name), func.lower(StructuredLead.last_name)).in_(names),
+            )
+        ))
+
+    company_ids = []
+    new_leads = []
+    leads_skipped = 0
+    for structured_lead, key in zip(leads, company_keys):
+        company_id = company_ids_by_url.get(key) if isinstance(key, str) else batch_company_ids.get(key)
+        if company_id is None:
+            continue  # Saving the company failed, skip this lead
+        company_ids.append(company_id)
+
+        # Set company ID and batch tag
+        structured_lead.company_id = company_id
+        structured_lead.tags = batch_tag
+
+        # Skip the lead if a duplicate exists, prefer existing
+        lead_keys = []
+        if structured_lead.email:
+            lead_keys.append(structured_lead.email.lower())
+        if structured_lead.first_name and structured_lead.last_name:
+            lead_keys.append((structured_lead.first_name.lower(), structured_lead.last_name.lower()))
+        if any(lead_key in existing_leads or lead_key in seen_leads for lead_key in lead_keys):
+            leads_skipped += 1
+            continue
+        seen_leads.update(lead_keys)
+        new_leads.append(structured_lead)
+
+    add_all_or_each(new_leads)
+    return company_ids, leads_skipped
 
 async def process_csv_file_async(csv_filepath: str):
     """
@@ -45,123 +234,130 @@ async def process_csv_file_async(csv_filepath: str):
     where N is the batch number for that day.
     """
     # Get today's date in 'DD-MM-YYYY' format
-    today_str = datetime.now().strftime('%d-%m-%Y')
+    today = datetime.now().date()
+    today_str = today.strftime('%d-%m-%Y')
 
-    # Determine the current batch number (N) for today
-    current_batch_count = (
-        db.session.query(func.count(func.distinct(StructuredLead.tags)))
-        .filter(
-            StructuredLead.tags.like(f'import-batch {today_str}/%')
+    # Determine the current batch number (N) for today from the daily import counter.
+    # A new day starts at the number of batches already tagged that day, which is only non-zero
+    # for days that had imports before the counter existed.
+    if db.session.get(ImportBatchCounter, today) is None:
+        existing_batches = (
+            db.session.query(func.count(func.distinct(LeadTag.tag)))
+            .filter(LeadTag.tag.like(f'import-batch {today_str}/%'))
+            .scalar()
+        )
+    else:
+        existing_batches = 0
+    imports_today = db.session.scalar(
+        upsert_insert(ImportBatchCounter)
+        .values(day=today, imports=existing_batches + 1)
+        .on_conflict_do_update(
+            index_elements=[ImportBatchCounter.day],
+            set_={'imports': ImportBatchCounter.imports + 1}
         )
-        .scalar()
+        .returning(ImportBatchCounter.imports)
     )
+    # Committed right away, so concurrent imports get their own number without waiting for this one
+    db.session.commit()
 
-    # The next batch is N=current_batch_count
-    batch_index = current_batch_count
+    # The next batch is N=imports_today - 1
+    batch_index = imports_today - 1
 
     # Create the tag for this batch
     batch_tag = f'import-batch {today_str}/{batch_index}'
 
-    # Convert the CSV into a list of dictionaries
-    list_of_dicts = csv_to_json_list(csv_filepath)
-
-    # Filter out rows with insufficient data
-    valid_rows = []
+    # The CSV is read lazily into a bounded queue, AI_CONCURRENCY workers create the company and lead
+    # of each row with the AI and the results are written to the database in batches as they come in.
+    # Only the queued rows and the current batch are kept in memory.
+    start_time = time.time()
+    rows = asyncio.Queue(maxsize=ROW_QUEUE_SIZE)
+    results = asyncio.Queue()
     skipped_rows = []
 
-    for row in list_of_dicts:
-        if len("".join(row.values())) >= 20:
-            valid_rows.append(row)
-        else:
-            skipped_rows.append(row)
-
-    # Process company creation in parallel using async
-    start_time = time.time()
-    company_tasks = []
-    for row in valid_rows:
-        company_tasks.append(Company.create_with_ai_async(str(row)))
-    
-    # Wait for all company creation tasks to complete
-    companies = await asyncio.gather(*company_tasks)
-    print(f"Time taken to create companies: {time.time() - start_time} seconds")
-    # Process company duplicates and get company IDs
-    company_ids = []
-    valid_companies = []
-    valid_indices = []
-    
-    for i, company in enumerate(companies):
-        row = valid_rows[i]
-        
-        # Add the batch tag to the company
-        company.tags = batch_tag
+    async def read_rows():
+        try:
+            for row in csv_to_json_iter(csv_filepath):
+                # Filter out rows with insufficient data
+                if sum(len(value or '') for value in row.values()) >= 20:
+                    await rows.put(row)
+                else:
+                    skipped_rows.append(row)
+        finally:
+            for _ in range(AI_CONCURRENCY):
+                await rows.put(None)  # Tells each worker to stop
 
-        # Handle potential duplicates, prefer existing company
-        other_company = company.look_for_duplicate()
-        if not other_company:
-            db.session.add(company)
+    async def create_with_ai():
+        while (row := await rows.get()) is not None:
             try:
-                db.session.flush()  # Get the ID
-                company_id = company.id
-                company_ids.append(company_id)
-                valid_companies.append(company)
-                valid_indices.append(i)
-                start_render_and_upload_if_not_exist(company_id)
+                company, structured_lead = await create_company_and_lead_async(row)
             except Exception as e:
-                logger.error(f"Error flushing session for row: {row}, company: {company.dict()}. Exception: {e}", exc_info=True)
-                # ignore this lead
-                db.session.rollback()
-                continue  # Skip this lead
-        else:
-            # TODO: maybe merge the company infos
-            company_id = other_company.id
-            company_ids.append(company_id)
-            valid_companies.append(company)
-            valid_indices.append(i)
-            start_render_and_upload_if_not_exist(company_id)
-    
-    # Now process leads in parallel
-    lead_tasks = []
-    for i in valid_indices:
-        row = valid_rows[i]
-        lead_tasks.append(StructuredLead.create_using_ai_async(str(row)))
-    
-    # Wait for all lead creation tasks to complete
-    structured_leads = await asyncio.gather(*lead_tasks)
-    
-    # Process lead duplicates and finalize
+                logger.error(f"Error creating company and lead with AI for row: {row}. Exception: {e}", exc_info=True)
+                skipped_rows.append(row)
+                continue
+            await results.put((row, company, structured_lead))
+        await results.put(None)  # This worker is done
+
+    pipeline = asyncio.gather(read_rows(), *(create_with_ai() for _ in range(AI_CONCURRENCY)))
+
+    company_ids = []
     leads_processed = 0
     leads_skipped = 0
-    
-    for i, structured_lead in enumerate(structured_leads):
-        leads_processed += 1
-        idx = valid_indices[i]
-        company_id = company_ids[i]
-        
-        # Set company ID and batch tag
-        structured_lead.company_id = company_id
-        structured_lead.tags = batch_tag
+    company_ids_by_url = {}
+    seen_leads = set()
+    batch = []
+    workers_running = AI_CONCURRENCY
 
-        # Handle potential duplicate leads, prefer existing
-        other_lead = structured_lead.look_for_duplicate()
-        if not other_lead:
-            db.session.add(structured_lead)
-            try:
-                db.session.flush()  # Get the ID
-            except Exception as e:
-                logger.error(f"Error flushing session for lead: {structured_lead.dict()}. Exception: {e}", exc_info=True)
-                # ignore this lead
-                db.session.rollback()
-                continue  # Skip this lead
+    while workers_running:
+        result = await results.get()
+        if result is None:
+            workers_running -= 1
         else:
-            # Skip if duplicate exists
-            leads_skipped += 1
-            continue  # skip this lead
+            batch.append(result)
+        if batch and (len(batch) >= INSERT_BATCH_SIZE or not workers_running):
+            batch_company_ids, batch_skipped = await save_import_batch_async(batch, batch_tag, company_ids_by_url, seen_leads)
+            company_ids.extend(batch_company_ids)
+            leads_processed += len(batch_company_ids)
+            leads_skipped += batch_skipped
+            batch = []
+    await pipeline
+    print(f"Time taken to create companies and leads: {time.time() - start_time} seconds")
+
+    # Queue the video render tasks for all companies of this import at once
+    start_render_and_upload_for_companies(company_ids)
 
     # Commit all changes at once
     db.session.commit()
 
     return leads_processed, leads_skipped, batch_tag, skipped_rows
 
+async def check_csv_for_missing_info(csv_text: str, csv_filepath: str) -> Optional[str]:
+    """
+    Asks the AI whether the CSV is missing required lead information (first name, email, company, website, niche).
+
+    Args:
+        csv_text: Content of the uploaded CSV file
+        csv_filepath: Path the file was saved to, for logging
+
+    Returns:
+        Optional[str]: The AI's explanation of what is missing, or None if the file looks complete
+                       (or the check could not be completed in time)
+    """
+    try:
+        response = await asyncio.wait_for(
+            run_prompt_with_gemini_cached_async(create_prompt_for_csv_check_instructions(), create_prompt_for_csv_check(csv_text)),
+            timeout=CSV_CHECK_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"CSV pre-check timed out after {CSV_CHECK_TIMEOUT}s, importing {csv_filepath} unchecked")
+        return None
+
+    if not response:
+        logger.warning(f"CSV pre-check failed, importing {csv_filepath} unchecked")
+        return None
+    if 'MISSING_INFO' in response:
+        return response.split('MISSING_INFO')[1][1:]
+    return None
+
 def process_csv_file(csv_filepath: str):
     """
     Process a single CSV file, map columns, and add leads to the database.
@@ -170,6 +366,10 @@ def process_csv_file(csv_filepath: str):
     
     This function is a synchronous wrapper around the async version.
     """
-    return asyncio.run(process_csv_file_async(csv_filepath))
+    with count_queries(db.engine) as queries:
+        result = asyncio.run(process_csv_file_async(csv_filepath))
+    leads_processed, leads_skipped, batch_tag, skipped_rows = result
+    logger.info(f"CSV import {batch_tag}: {leads_processed} leads processed, {leads_skipped} duplicates skipped, {len(skipped_rows)} rows skipped, {len(queries)} queries")
+    return result
 
 
@@ -1,6 +1,8 @@
 # drive_oauth.py
 
 import os
+import logging
+import threading
 import mimetypes
 from datetime import datetime, timedelta
 from google_auth_oauthlib.flow import Flow
@@ -8,11 +10,14 @@ from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
+from sqlalchemy import select
 
 from models import DriveAccount, db
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DRIVE_SCOPES = [
     "https://www.googleapis.com/auth/drive.file",
     "https://www.googleapis.com/auth/userinfo.email",
@@ -20,27 +25,43 @@ DRIVE_SCOPES = [
     "https://www.googleapis.com/auth/userinfo.profile"
 ]
 
+# OAuth client settings, read once at import
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+if not (GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET):
+    logger.warning("GOOGLE_CLIENT_ID or GOOGLE_CLIENT_SECRET is not set, connecting Google Drive accounts will fail.")
+
+# Size of each request of a resumable upload, and the file size from which uploads are resumable
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+
+# Drive services by account id, see get_drive_service
+_drive_services = threading.local()
+
+_REDIRECT_URI = "https://atomic.steamlined.solutions/drive/oauth2callback"
+_CLIENT_CONFIG = {
+    "web": {
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "redirect_uris": [_REDIRECT_URI]
+    }
+}
+
 def create_drive_oauth_flow(state=None):
     """
     Create an OAuth flow for Google Drive with your client config.
     You might want to adapt the redirect URI to the route for the drive blueprint.
     """
-    redirect_uri = "https://atomic.steamlined.solutions/drive/oauth2callback"
-    client_config = {
-        "web": {
-            "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-            "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "redirect_uris": [redirect_uri]
-        }
-    }
+    if not (GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET):
+        raise RuntimeError("GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET must be set to connect a Google Drive account.")
 
     flow = Flow.from_client_config(
-        client_config,
+        _CLIENT_CONFIG,
         scopes=DRIVE_SCOPES,
         state=state,
-        redirect_uri=redirect_uri
+        redirect_uri=_REDIRECT_URI
     )
     return flow
 
@@ -64,7 +85,9 @@ def save_drive_credentials(user, credentials, drive_user_info):
     Similar to how you used to save YouTube credentials, 
     but now we store drive-specific info.
     """
-    acct = DriveAccount.query.filter_by(email=drive_user_info['email'], user_id=user.id).first()
+    acct = db.session.scalar(
+        select(DriveAccount).where(DriveAccount.user_id == user.id, DriveAccount.email == drive_user_info['email'])
+    )
     if not acct:
         acct = DriveAccount(
             email=drive_user_info['email'],
@@ -91,8 +114,8 @@ def get_valid_drive_credentials(account):
         token=account.access_token,
         refresh_token=account.refresh_token,
         token_uri="https://oauth2.googleapis.com/token",
-        client_id=os.getenv("GOOGLE_CLIENT_ID"),
-        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
         scopes=DRIVE_SCOPES
     )
 
@@ -113,9 +136,27 @@ def get_valid_drive_credentials(account):
     return creds
 
 
+def get_drive_service(account):
+    """
+    Get a Drive API service for the account, reusing the one built earlier until its credentials expire.
+    Services are kept per thread, as the HTTP connection they wrap is not thread-safe.
+    """
+    services = _drive_services.__dict__.setdefault('by_account', {})
+    cached = services.get(account.id)
+    if cached and not cached[1].expired:
+        return cached[0]
+
+    creds = get_valid_drive_credentials(account)
+    service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    services[account.id] = (service, creds)
+    return service
+
+
 def upload_file_to_drive(file_path, title, user_id=None, folder_id=None):
     """
     Upload a file to Google Drive, returning a shareable link.
+    Blocks until the upload is done, so it is only called from the Task_worker upload threads
+    (see UPLOAD_WORKERS there), never from a Flask request.
     
     - file_path: local path to the MP4
     - user_id: which user this belongs to
@@ -126,9 +167,7 @@ def upload_file_to_drive(file_path, title, user_id=None, folder_id=None):
     # pick an account (like how you used to pick a random or specific YT channel),
     # but now it’s drive accounts:
     acct = pick_drive_account_for_upload(user_id)  # implement your logic
-    creds = get_valid_drive_credentials(acct)
-    
-    drive_service = build('drive', 'v3', credentials=creds)
+    drive_service = get_drive_service(acct)
     
     # Create metadata
     file_metadata = {
@@ -137,17 +176,22 @@ def upload_file_to_drive(file_path, title, user_id=None, folder_id=None):
     if folder_id:
         file_metadata['parents'] = [folder_id]
     
-    media = MediaFileUpload(file_path, mimetype='video/mp4', resumable=True)
+    # Small files go up in a single request, bigger ones resumable in large chunks to keep round trips low
+    resumable = os.path.getsize(file_path) >= RESUMABLE_UPLOAD_THRESHOLD
+    media = MediaFileUpload(file_path, mimetype='video/mp4', resumable=resumable, chunksize=UPLOAD_CHUNK_SIZE)
 
     request = drive_service.files().create(
         body=file_metadata,
         media_body=media,
         fields='id'
     )
-    response = None
-    while response is None:
-        status, response = request.next_chunk()
-        # optional: track upload progress
+    if resumable:
+        response = None
+        while response is None:
+            status, response = request.next_chunk()
+            # optional: track upload progress
+    else:
+        response = request.execute()
     file_id = response.get('id')
 
     # Make it shareable, for instance "anyone with the link can view"
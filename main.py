@@ -1,21 +1,29 @@
-from flask import Flask, Blueprint, render_template, request, redirect, url_for, jsonify, session, send_file, send_from_directory, abort, current_app
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, jsonify, session, send_file, send_from_directory, abort, current_app, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_login import login_required, current_user
 import os, sys
+import json
+import orjson
+import re
 import threading
+import queue
+import time
+import asyncio
 from werkzeug.utils import secure_filename
 import csv_parser
-from models import init_db, DriveAccount, db, Lead, LeadData, ProcessingTask, FieldDefinition, ExportTemplate, StructuredLead, Company
+from models import init_db, DriveAccount, db, Lead, LeadData, ProcessingTask, ExportTemplate, StructuredLead, Company, LeadTag, ImportIssue, split_tags
 from auth import init_auth
 import logging
 import pandas as pd
-from io import BytesIO
+from io import BytesIO, StringIO
 from datetime import datetime, timedelta
 import AI_database_agent
 import csv
-from sqlalchemy import or_
+from sqlalchemy import or_, select, func, case, update, insert, delete, cast, Integer
 from drive import drive_bp
-from utils.ai_basic_functions import run_prompt_with_gemini
 from utils.role_helpers import roles_required
+from utils.csv_tools import get_field_definitions
+from utils.db_tools import chunked
 
 
 # Set up logging
@@ -26,8 +34,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Encodes and decodes JSON with orjson, which is several times faster than the stdlib json module.
+    Datetimes are written as ISO 8601, types orjson doesn't support fall back to Flask's default handling.
+    """
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Create Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 logger.debug(f"Template folder path: {app.template_folder}")
 
 # Add max and min functions to the Jinja2 environment
@@ -36,24 +59,83 @@ app.jinja_env.globals.update(max=max, min=min)
 # Create blueprint for main routes
 main_bp = Blueprint('main', __name__)
 
-def run_csv_import_in_thread(app, filepath):
-    """Worker executed in a detached thread."""
+# Uploaded CSVs waiting for the import worker: (filepath, user_id, csv_text)
+_import_queue = queue.Queue()
+_import_worker_lock = threading.Lock()
+_import_worker = None
+
+def run_csv_import(app, filepath, user_id, csv_text):
+    """
+    Imports one uploaded CSV, run by the import worker.
+    Runs the AI pre-check first; files with missing information are not imported and
+    the feedback is stored for the uploader instead.
+    """
     with app.app_context():
         try:
+            feedback = asyncio.run(csv_parser.check_csv_for_missing_info(csv_text, filepath))
+            if feedback:
+                db.session.add(ImportIssue(user_id=user_id, filename=os.path.basename(filepath), feedback=feedback))
+                db.session.commit()
+                logger.info(f"CSV import skipped, missing information in file: {filepath}")
+                return
             csv_parser.process_csv_file(filepath)
+            clear_batch_manager_cache()
             logger.info(f"CSV import completed successfully for file: {filepath}")
         except Exception:
             logger.exception(f"CSV import failed for file: {filepath}")
 
+def csv_import_worker(app):
+    """Runs the queued CSV imports one after another, so uploads don't compete as concurrent SQLite writers."""
+    while True:
+        filepath, user_id, csv_text = _import_queue.get()
+        try:
+            run_csv_import(app, filepath, user_id, csv_text)
+        finally:
+            _import_queue.task_done()
+
+def enqueue_csv_import(app, filepath, user_id, csv_text):
+    """
+    Queues an uploaded CSV for import, starting the import worker thread on first use.
+
+    Returns:
+        int: Number of imports ahead of this one
+    """
+    global _import_worker
+    with _import_worker_lock:
+        if _import_worker is None:
+            _import_worker = threading.Thread(target=csv_import_worker, args=(app,), daemon=True)  # dies with the main process
+            _import_worker.start()
+    imports_ahead = _import_queue.unfinished_tasks
+    _import_queue.put((filepath, user_id, csv_text))
+    return imports_ahead
+
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'fallback-secret-key')
 app.config['UPLOAD_FOLDER'] = 'data'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+UPLOAD_WRITE_BUFFER_SIZE = 1024 * 1024  # Saved uploads are written in 1MB chunks
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Sized for the concurrent CSV imports, AI agent tool calls and worker threads sharing the engine.
+# 25-50 connections is the usual sweet spot for server databases, SQLite still serializes writers.
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 25,
+    'max_overflow': 25,
+    'pool_pre_ping': True,  # Drop dead connections before handing them out
+    'pool_recycle': 1800,  # Recycle connections every 30 minutes
+    'json_deserializer': orjson.loads,  # db.JSON columns, e.g. ExportTemplate.columns
+}
 app.config['WTF_CSRF_ENABLED'] = False  # Temporarily disable CSRF
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)  # Set session lifetime
 
+# Seconds a computed batch manager page is reused; the batch routes and CSV imports clear it right away
+BATCH_MANAGER_CACHE_TTL = 30
+# page -> (expiry time, (batch_info_list, pagination))
+_batch_manager_cache = {}
+
+# Error messages shown per batch in the batch manager, the rest are summarized as "... and N more errors"
+MAX_BATCH_ERROR_MESSAGES = 5
+
 # Initialize database and authentication
 logger.debug("Initializing database...")
 init_db(app)
@@ -66,9 +148,10 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 @app.before_request
 def before_request():
     """Ensure user session is handled correctly."""
-    if current_user.is_authenticated:
+    # Only set it once: assigning marks the session modified, which re-signs the cookie.
+    # The lifetime comes from PERMANENT_SESSION_LIFETIME.
+    if current_user.is_authenticated and not session.permanent:
         session.permanent = True  # Make session permanent
-        app.permanent_session_lifetime = timedelta(days=30)
 
 
 @app.route('/output/<path:filename>')
@@ -110,6 +193,17 @@ def index():
 def upload_file():
     """Handle CSV file uploads"""
     message = None
+    if request.method == 'GET':
+        # Show the pre-check feedback of earlier uploads once
+        import_issues = ImportIssue.query.filter_by(user_id=current_user.id).order_by(ImportIssue.created_at).all()
+        if import_issues:
+            message = '\n\n'.join(
+                f'Missing information in the CSV file {issue.filename}. Please check the file and try again.\n\nFeedback:\n{issue.feedback}'
+                for issue in import_issues
+            )
+            for issue in import_issues:
+                db.session.delete(issue)
+            db.session.commit()
     if request.method == 'POST':
         if 'file' not in request.files:
             message = 'No file part'
@@ -124,74 +218,23 @@ def upload_file():
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            with open(filepath, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            prompt = f"""
-You are a helpful assistant that analyzes a CSV file to determine if all the necessary information is present.
-The CSV file is for a list of Leads+Companies.
-
-Each actual entry has to have the information about first name, email, company name, website url and niche or something (like 'BC blue collar', 'coaching' or whatever).
-This is just a safety check to make sure the CSV file is not missing any important information.
-It is very likely that all the information is present, but we want to be sure.
-Other information is not important and can be missing. We just need the basic information (first name, email, company name, website url and niche or something).
-
-If any of this information is missing, you should return write 'MISSING_INFO: explanaition of what is missing' at the end of your response. If no information is missing, return 'ALL_GOOD' at the end.
-So now alanlyse critically the csv and write if the information is missing for any Lead. Please explain what is missing if something is missing in understandable form.
-Example 1:
-Input:
-```csv
-First Name, Last Name, Email, Company Name, Website URL, Type
-John, Doe, john.doe@example.com, Example Inc, https://example.com,na
-Jane, Smith,, Example Corp, https://example.com, "coaching"
-```
-Output:
-```
-Okay, I will analyze the CSV data to check for missing information in the required fields: FirstName, email, CompanyName, Website Link, and Niche.
-Here's the analysis:
-* **John Doe** has missing type/niche
-* **Jane Smith** has missing email
-
-Example 2:
-Input:
-```csv
-First Name, Last Name, Email, Company Name, Website URL, Type, Phone, LinkedIn URL
-Justin, D., justin.doe@example.com, Example Inc, https://example.com, "bc", na, na
-Fleur,, fleur.smith@example.com, Example Corp, https://example.com, "construction", na, na
-```
-Output:
-```
-Okay, I will analyze the CSV data to check for missing information in the required fields: FirstName, email, CompanyName, Website Link, and Niche.
-Here's the analysis:
-* **Justin D.** has all basic information
-* **Fleur** has all basic information
-
-Conslusion:
-ALL_GOOD
-```
-
-Now it's your turn.
-```csv
-{text}
-```
-So now alanlyse critically the csv and write if the information is missing for any Lead. Please explain what is missing if something is missing .
-"""
-            response = run_prompt_with_gemini(prompt=prompt)
-            if 'MISSING_INFO' in response:
-                message = 'Missing information in the CSV file. Please check the file and try again.\n\nFeedback:\n' + response.split('MISSING_INFO')[1][1:]
+            # Read the upload once: the text goes to the pre-check, the importer reads the saved file
+            raw = file.read()
+            try:
+                csv_text = raw.decode('utf-8')
+            except UnicodeDecodeError:
+                message = 'Could not read the file. Please upload a UTF-8 encoded CSV file.'
                 return render_template('upload.html', message=message)
-            
-            # Kick off background processing
-            t = threading.Thread(
-                target=run_csv_import_in_thread,
-                args=(current_app._get_current_object(), filepath),
-                daemon=True           # dies with the main process
-            )
-            t.start()
+            with open(filepath, 'wb', buffering=UPLOAD_WRITE_BUFFER_SIZE) as f:
+                f.write(raw)
+
+            # Queue for background processing
+            imports_ahead = enqueue_csv_import(current_app._get_current_object(), filepath, current_user.id, csv_text)
 
-            message = "File received – processing has started in the background."
+            if imports_ahead:
+                message = f"File received – it will be processed in the background after {imports_ahead} earlier upload(s)."
+            else:
+                message = "File received – processing has started in the background."
             return render_template('upload.html', message=message)
         else:
             message = 'Invalid file type. Please upload a CSV file.'
@@ -222,7 +265,7 @@ def create_export_template():
     """
     Create a new export template.
     """
-    all_fields = FieldDefinition.query.all()
+    all_fields = get_field_definitions()
 
     if request.method == 'POST':
         template_name = request.form.get('templateName', '').strip()
@@ -246,6 +289,7 @@ def create_export_template():
         new_template.set_columns(columns)
         db.session.add(new_template)
         db.session.commit()
+        AI_database_agent.invalidate_exporting_templates_cache()
 
         return redirect(url_for('main.list_export_templates'))
 
@@ -268,7 +312,7 @@ def edit_export_template(template_id: int):
         id=template_id, user_id=current_user.id
     ).first_or_404()
 
-    all_fields = FieldDefinition.query.all()
+    all_fields = get_field_definitions()
 
     if request.method == 'POST':
         template_name = request.form.get('templateName', '').strip()
@@ -278,6 +322,7 @@ def edit_export_template(template_id: int):
         template.set_columns(columns)
         template.updated_at = datetime.utcnow()
         db.session.commit()
+        AI_database_agent.invalidate_exporting_templates_cache()
 
         return redirect(url_for('main.list_export_templates'))
 
@@ -305,6 +350,7 @@ def delete_export_template(template_id: int):
 
     db.session.delete(template)
     db.session.commit()
+    AI_database_agent.invalidate_exporting_templates_cache()
     return jsonify({'status': 'deleted'}), 200
 
 @main_bp.route('/export/do', methods=['POST'])
@@ -323,6 +369,26 @@ def do_export():
     logger.info(f"User {current_user.id} wants to export leads {lead_ids} with template {template_id}")
     return jsonify({'status': 'ok', 'message': 'Export initiated (placeholder)'}), 200
 
+@main_bp.route('/export/<export_id>')
+@login_required
+@roles_required('admin')  # Only admins can download AI agent exports
+def stream_export(export_id):
+    """Stream a CSV export prepared by the AI agent, straight from the database."""
+    if not re.fullmatch(r'[0-9a-f]{16}', export_id):
+        abort(404)
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', export_id + '.json')
+    if not os.path.exists(path):
+        abort(404)
+    with open(path) as f:
+        export = json.load(f)
+
+    rows = AI_database_agent.generate_csv(export['columns'], export['lead_ids'])
+    return Response(
+        stream_with_context(rows),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="Exported Leads.csv"'}
+    )
+
 @main_bp.route('/api/export/templates', methods=['GET'])
 @login_required
 @roles_required('admin')  # Only admins can access export template API
@@ -330,16 +396,22 @@ def api_list_export_templates():
     """
     Return the list of export templates as JSON.
     """
-    user_templates = ExportTemplate.query.filter_by(user_id=current_user.id).all()
-    results = []
-    for t in user_templates:
-        results.append({
-            'id': t.id,
-            'name': t.name,
-            'columns': t.get_columns(),
-            'created_at': t.created_at.isoformat(),
-            'updated_at': t.updated_at.isoformat()
-        })
+    # Only serialized, so select the columns instead of loading ExportTemplate objects
+    rows = db.session.execute(
+        select(ExportTemplate.id, ExportTemplate.name, ExportTemplate.columns,
+               ExportTemplate.created_at, ExportTemplate.updated_at)
+        .where(ExportTemplate.user_id == current_user.id)
+    )
+    results = [
+        {
+            'id': row.id,
+            'name': row.name,
+            'columns': row.columns,
+            'created_at': row.created_at,
+            'updated_at': row.updated_at
+        }
+        for row in rows
+    ]
     return jsonify({'templates': results})
 
 @main_bp.route('/leads_overview')
@@ -351,31 +423,91 @@ def leads_overview():
     per_page = request.args.get('per_page', 50, type=int)
     search = request.args.get('search', '')
     
-    # Create a query for structured leads
-    query = StructuredLead.query
-    
-    # Apply search if provided
+    # The page only renders the leads, so select plain rows of the shown columns (keyed like dict_with_company)
+    # instead of loading StructuredLead and Company objects
+    page_columns = [
+        StructuredLead.id.label('id'),
+        StructuredLead.company_id.label('company_id'),
+        StructuredLead.created_at.label('created_at'),
+        StructuredLead.first_name.label('first_name'),
+        StructuredLead.last_name.label('last_name'),
+        StructuredLead.email.label('email'),
+        StructuredLead.phone.label('phone'),
+        StructuredLead.linkedin_url.label('linkedin_url'),
+        StructuredLead.tags.label('tags'),
+        Company.name.label('company_name'),
+        Company.website_url.label('company_website_url'),
+        Company.niche_category.label('company_niche_category'),
+        Company.is_running_ads.label('company_is_running_ads'),
+        Company.custom_youtube_video.label('company_custom_youtube_video'),
+        Company.ads_url.label('company_ads_url'),
+        Company.tags.label('company_tags'),
+    ]
+    search_filter = None
     if search:
         search_term = f"%{search}%"
-        query = query.filter(or_(
+        search_filter = or_(
             StructuredLead.first_name.ilike(search_term),
             StructuredLead.last_name.ilike(search_term),
             StructuredLead.email.ilike(search_term),
             # Add more fields as needed
-        ))
-    
-    # Paginate the query
-    leads_pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        )
+
+    page = max(page, 1)
+    per_page = max(per_page, 1)
+    leads_query = (
+        select(*page_columns)
+        .outerjoin(Company, Company.id == StructuredLead.company_id)
+        .order_by(StructuredLead.id)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    )
+    count_query = select(func.count()).select_from(StructuredLead)
+    if search_filter is not None:
+        leads_query = leads_query.where(search_filter)
+        count_query = count_query.where(search_filter)
+    page_leads = [dict(row) for row in db.session.execute(leads_query).mappings()]
+    total_leads = db.session.scalar(count_query)
+    total_pages = (total_leads + per_page - 1) // per_page  # Ceiling division
     
-    leads_data = []
-    for lead in leads_pagination.items:
-        lead_info = lead.dict_with_company()
+    # Fetch the latest task per lead and per company on this page in one query: the window functions
+    # rank the tasks of each lead and each company by recency (backed by the *_updated indexes)
+    lead_ids = [lead['id'] for lead in page_leads]
+    company_ids = [lead['company_id'] for lead in page_leads]
+    latest_task_by_lead = {}
+    latest_task_by_company = {}
+    if lead_ids:
+        ranked_tasks = (
+            select(
+                ProcessingTask.id,
+                func.row_number().over(
+                    partition_by=ProcessingTask.structured_lead_id,
+                    order_by=ProcessingTask.updated_at.desc()
+                ).label('lead_rank'),
+                func.row_number().over(
+                    partition_by=ProcessingTask.company_id,
+                    order_by=ProcessingTask.updated_at.desc()
+                ).label('company_rank'),
+            )
+            .where(or_(ProcessingTask.structured_lead_id.in_(lead_ids),
+                       ProcessingTask.company_id.in_(company_ids)))
+            .subquery()
+        )
+        page_tasks = (
+            db.session.query(ProcessingTask, ranked_tasks.c.lead_rank, ranked_tasks.c.company_rank)
+            .join(ranked_tasks, ranked_tasks.c.id == ProcessingTask.id)
+            .filter(or_(ranked_tasks.c.lead_rank == 1, ranked_tasks.c.company_rank == 1))
+        )
+        for task, lead_rank, company_rank in page_tasks:
+            if task.structured_lead_id is not None and lead_rank == 1:
+                latest_task_by_lead[task.structured_lead_id] = task
+            if task.company_id is not None and company_rank == 1:
+                latest_task_by_company[task.company_id] = task
 
-        # Fetch the latest task related to this lead OR company.  Prioritize lead-related tasks.
-        latest_task = ProcessingTask.query.filter(
-            or_(ProcessingTask.structured_lead_id == lead.id,
-                ProcessingTask.company_id == lead.company_id)
-        ).order_by(ProcessingTask.structured_lead_id.desc(), ProcessingTask.updated_at.desc()).first()
+    leads_data = []
+    for lead_info in page_leads:
+        # Prioritize lead-related tasks
+        latest_task = latest_task_by_lead.get(lead_info['id']) or latest_task_by_company.get(lead_info['company_id'])
 
         if latest_task:
             lead_info['task_status'] = latest_task.status
@@ -386,8 +518,15 @@ def leads_overview():
 
         leads_data.append(lead_info)
 
-    # Get total number of leads for pagination info
-    total_leads = leads_pagination.total
+    # Pagination info, with the attribute names of Flask-SQLAlchemy's Pagination used by the template
+    pagination = {
+        'page': page,
+        'pages': total_pages,
+        'has_prev': page > 1,
+        'has_next': page < total_pages,
+        'prev_num': page - 1 if page > 1 else None,
+        'next_num': page + 1 if page < total_pages else None,
+    }
 
     # Define the order of fields for display
     ordered_fields_names = [
@@ -412,7 +551,7 @@ def leads_overview():
         'leads_overview.html', 
         leads_data=leads_data, 
         ordered_fields=ordered_fields_names,
-        pagination=leads_pagination,
+        pagination=pagination,
         total_leads=total_leads,
         search=search
     )
@@ -441,6 +580,7 @@ def start_render():
     
     from automation_manager import start_render_and_upload_if_not_exist
     result = start_render_and_upload_if_not_exist(company_id, overwrite_conditions)
+    clear_batch_manager_cache()
 
     if result['status'] == 'created':
         return jsonify({'status': 'created', 'task_id': result['task_id']})
@@ -477,45 +617,49 @@ def batch_manager():
     Displays each batch with the progress of how many leads have a Drive video (via Company's custom_youtube_video) vs total leads.
     Also shows how many have tasks that failed.
     If progress < 100%, the user can still click Export, which will only export leads with YT links.
+    The page data is cached for BATCH_MANAGER_CACHE_TTL seconds.
     """
     # Get page number from query params, default to 1
     page = request.args.get('page', 1, type=int)
+
+    expires_at, page_data = _batch_manager_cache.get(page, (0, None))
+    if time.monotonic() >= expires_at:
+        page_data = get_batch_manager_page(page)
+        _batch_manager_cache[page] = (time.monotonic() + BATCH_MANAGER_CACHE_TTL, page_data)
+    batch_info_list, pagination = page_data
+
+    return render_template('batch_manager.html', 
+                          batch_info_list=batch_info_list, 
+                          pagination=pagination)
+
+def clear_batch_manager_cache():
+    """Drops the cached batch manager pages, called after a batch or its tasks change."""
+    _batch_manager_cache.clear()
+
+def get_batch_manager_page(page):
+    """
+    Computes the batch manager data for a page: the batches' progress and the pagination info.
+
+    Args:
+        page (int): Requested page number, clamped to the existing pages
+
+    Returns:
+        tuple: (batch_info_list, pagination)
+    """
     per_page = 10  # Number of batches per page
 
-    # Step 1: Retrieve all tags that contain 'import-batch' from StructuredLead tags column
-    batch_tags_data = (
-        db.session.query(StructuredLead.tags)
-        .filter(StructuredLead.tags.ilike('%import-batch%'))
-        .all()
+    # Step 1: The distinct import-batch tags, read from the lead_tags index
+    # (a range on the prefix, since SQLite's case-insensitive LIKE can't use the index)
+    batch_tags = (
+        select(LeadTag.tag)
+        .where(LeadTag.tag >= 'import-batch', LeadTag.tag < 'import-batci')
+        .distinct()
+        .subquery()
     )
-    
-    # Step 2: Extract individual import-batch tags
-    import_tags_set = set()
-    for row in batch_tags_data:
-        if row[0]:
-            tags = [tag.strip() for tag in row[0].split(',')]
-            import_tags = [tag for tag in tags if tag.startswith('import-batch')]
-            import_tags_set.update(import_tags)
-    
-    # Step 3: Convert to list and sort by date (newest first)
-    def parse_tag(tag):
-        # Expected tag format: "import-batch DD-MM-YYYY/N"
-        try:
-            # Split the tag into prefix and the date/N part
-            parts = tag.split()
-            if len(parts) < 2:
-                return (0, 0, 0, 0)
-            date_and_n = parts[1]
-            date_part, n_part = date_and_n.split('/')
-            day, month, year = date_part.split('-')
-            return (int(year), int(month), int(day), int(n_part))
-        except Exception:
-            return (0, 0, 0, 0)
-    
-    all_batch_tags = sorted(list(import_tags_set), key=parse_tag, reverse=True)
-    
-    # Step 4: Calculate pagination values
-    total_batches = len(all_batch_tags)
+    tag_column = batch_tags.c.tag
+
+    # Step 2: Calculate pagination values
+    total_batches = db.session.scalar(select(func.count()).select_from(batch_tags))
     total_pages = (total_batches + per_page - 1) // per_page  # Ceiling division
     
     # Make sure page is within valid range
@@ -524,64 +668,94 @@ def batch_manager():
     elif page > total_pages and total_pages > 0:
         page = total_pages
     
-    # Step 5: Get only the batch tags for the current page
-    start_idx = (page - 1) * per_page
-    end_idx = min(start_idx + per_page, total_batches)
-    current_page_tags = all_batch_tags[start_idx:end_idx] if start_idx < total_batches else []
+    # Step 3: Get only the batch tags for the current page, sorted by date (newest first).
+    # Tags are "import-batch DD-MM-YYYY/N", tags in another format sort last
+    current_page_tags = db.session.scalars(
+        select(tag_column)
+        .order_by(
+            tag_column.op('GLOB')('import-batch [0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]/[0-9]*').desc(),
+            func.substr(tag_column, 20, 4).desc(),  # year
+            func.substr(tag_column, 17, 2).desc(),  # month
+            func.substr(tag_column, 14, 2).desc(),  # day
+            cast(func.substr(tag_column, 25), Integer).desc(),  # N
+        )
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).all()
     
-    # Step 6: For each batch tag on the current page, gather batch information
+    # Step 4: Count leads, videos and task statuses of the batches on the current page in one grouped query
+    batch_company_ids = (
+        select(StructuredLead.company_id)
+        .join(LeadTag)
+        .where(LeadTag.tag.in_(current_page_tags))
+    )
+    # Task status counts per company, joined to each lead of the batch below
+    company_task_counts = (
+        select(
+            ProcessingTask.company_id,
+            func.sum(case((ProcessingTask.status == 'failed', 1), else_=0)).label('failed'),
+            func.sum(case((ProcessingTask.status == 'pending', 1), else_=0)).label('pending'),
+            func.sum(case((ProcessingTask.status == 'in_progress', 1), else_=0)).label('in_progress'),
+        )
+        .where(ProcessingTask.company_id.in_(batch_company_ids))
+        .group_by(ProcessingTask.company_id)
+        .subquery()
+    )
+    batch_counts = (
+        db.session.query(
+            LeadTag.tag,
+            func.count(StructuredLead.id),
+            func.sum(case((func.trim(func.coalesce(Company.custom_youtube_video, '')) != '', 1), else_=0)),
+            # A lead counts as failed once, however many failed tasks its company has
+            func.sum(case((company_task_counts.c.failed > 0, 1), else_=0)),
+            func.coalesce(func.sum(company_task_counts.c.pending), 0),
+            func.coalesce(func.sum(company_task_counts.c.in_progress), 0),
+        )
+        .join(StructuredLead, StructuredLead.id == LeadTag.lead_id)
+        .outerjoin(Company, Company.id == StructuredLead.company_id)
+        .outerjoin(company_task_counts, company_task_counts.c.company_id == Company.id)
+        .filter(LeadTag.tag.in_(current_page_tags))
+        .group_by(LeadTag.tag)
+        .all()
+    )
+    counts_by_tag = {row[0]: row[1:] for row in batch_counts}
+
+    # Only batches with failed tasks need their error messages, and only the first MAX_BATCH_ERROR_MESSAGES
+    # distinct ones are decoded; the other distinct failures are only counted
+    error_messages_by_tag = {}
+    more_errors_by_tag = {}
+    seen_failures = set()
+    failed_tags = [tag for tag, counts in counts_by_tag.items() if counts[2]]
+    if failed_tags:
+        failed_tasks = (
+            db.session.query(LeadTag.tag, Company.name, ProcessingTask.result_data)
+            .join(StructuredLead, StructuredLead.id == LeadTag.lead_id)
+            .join(Company, Company.id == StructuredLead.company_id)
+            .join(ProcessingTask, ProcessingTask.company_id == Company.id)
+            .filter(LeadTag.tag.in_(failed_tags), ProcessingTask.status == 'failed')
+            .order_by(LeadTag.lead_id, ProcessingTask.id)
+        )
+        for tag, company_name, result_data in failed_tasks:
+            if not result_data or (tag, company_name, result_data) in seen_failures:
+                continue
+            seen_failures.add((tag, company_name, result_data))
+            error_messages = error_messages_by_tag.setdefault(tag, [])
+            if len(error_messages) >= MAX_BATCH_ERROR_MESSAGES:
+                more_errors_by_tag[tag] = more_errors_by_tag.get(tag, 0) + 1
+                continue
+            result_data = json.loads(result_data)
+            if 'error' in result_data:
+                error_message = f"Company: {company_name} - {result_data['error']}"
+                if error_message not in error_messages:
+                    error_messages.append(error_message)
+
     batch_info_list = []
     for tag in current_page_tags:
-        # Use LIKE patterns to match exact tags within the comma-separated string in the StructuredLead.tags column
-        leads_in_batch = (
-            db.session.query(StructuredLead)
-            .filter(
-                StructuredLead.tags.isnot(None),
-                or_(
-                    StructuredLead.tags == tag,
-                    StructuredLead.tags.like(f'{tag},%'),
-                    StructuredLead.tags.like(f'%, {tag},%'),
-                    StructuredLead.tags.like(f'%, {tag}')
-                )
-            )
-            .all()
-        )
-        
-        total_leads = len(leads_in_batch)
-
-        # Initialize counters
-        done_count = 0
-        failed_count = 0
-        pending_count = 0
-        in_progress_count = 0
-        error_messages = []
-
-        for lead in leads_in_batch:
-            # Check if the associated Company has a custom YouTube video link
-            if lead.company and lead.company.custom_youtube_video and lead.company.custom_youtube_video.strip():
-                done_count += 1
-            
-            # Process tasks for each company
-            if lead.company:
-                has_failed = False
-                for task in lead.company.tasks:
-                    if task.status == 'failed':
-                        has_failed = True
-                        failed_count += 1
-                        # Get error message from result_data if available
-                        result_data = task.get_result_data()
-                        if result_data and 'error' in result_data:
-                            error_message = f"Company: {lead.company.name} - {result_data['error']}"
-                            if error_message not in error_messages:
-                                error_messages.append(error_message)
-                    elif task.status == 'pending':
-                        pending_count += 1
-                    elif task.status == 'in_progress':
-                        in_progress_count += 1
-                
-                # Ensure we don't double-count companies with multiple failed tasks
-                if has_failed:
-                    failed_count -= (len([t for t in lead.company.tasks if t.status == 'failed']) - 1)
+        total_leads, done_count, failed_count, pending_count, in_progress_count = counts_by_tag.get(tag, (0, 0, 0, 0, 0))
+        error_messages = error_messages_by_tag.get(tag, [])
+        # Limit the number of error messages to prevent overwhelming the UI
+        if tag in more_errors_by_tag:
+            error_messages.append(f"... and {more_errors_by_tag[tag]} more errors")
 
         # Calculate percentages
         progress_percent = round((done_count / total_leads) * 100) if total_leads > 0 else 0
@@ -594,13 +768,6 @@ def batch_manager():
         if done_count + failed_count + pending_count + in_progress_count == total_leads:
             pending_in_progress_percent += 100 - (pending_in_progress_percent + progress_percent + failed_percent)
 
-            
-        # Limit the number of error messages to prevent overwhelming the UI
-        original_count = len(error_messages)
-        if original_count > 5:
-            error_messages = error_messages[:5]
-            error_messages.append(f"... and {original_count - 5} more errors")
-
         batch_info_list.append({
             'batch_tag': tag,
             'total_leads': total_leads,
@@ -613,7 +780,7 @@ def batch_manager():
             'error_messages': error_messages,
         })
     
-    # Step 7: Create pagination info to pass to the template
+    # Step 5: Create pagination info to pass to the template
     pagination = {
         'page': page,
         'total_pages': total_pages,
@@ -624,9 +791,7 @@ def batch_manager():
         'total_batches': total_batches,
     }
 
-    return render_template('batch_manager.html', 
-                          batch_info_list=batch_info_list, 
-                          pagination=pagination)
+    return batch_info_list, pagination
 
 @main_bp.route('/batch/render', methods=['POST'])
 @login_required
@@ -642,28 +807,34 @@ def render_batch():
     if not batch_tag:
         return jsonify({'status': 'error', 'message': 'No batch_tag provided'}), 400
 
-    # Retrieve all leads with this batch_tag
+    # Retrieve the companies of all leads with this batch_tag
     companies_in_batch = (
         db.session.query(Company)
-        .filter(Company.tags.contains(batch_tag))  # Assuming tags are comma-separated
+        .join(StructuredLead, StructuredLead.company_id == Company.id)
+        .join(LeadTag)
+        .filter(LeadTag.tag == batch_tag)
+        .distinct()
         .all()
     )
 
     if not companies_in_batch:
         return jsonify({'status': 'error', 'message': 'No leads found for that batch'}), 404
 
-    # Reset failed tasks to 'pending' for all these leads
-    for company in companies_in_batch:
-        for task in company.tasks:
-            if task.status == 'failed':
-                task.status = 'pending'
-                task.updated_at = datetime.utcnow()
+    # Reset failed tasks to 'pending' for all these leads in one UPDATE (updated_at is set by the column's onupdate)
+    db.session.execute(
+        update(ProcessingTask)
+        .where(ProcessingTask.company_id.in_([company.id for company in companies_in_batch]),
+               ProcessingTask.status == 'failed')
+        .values(status='pending')
+        .execution_options(synchronize_session=False)
+    )
     db.session.commit()
 
     # Start render+upload tasks
     # overwrite_conditions=True ensures we create fresh tasks even if previous ones existed
     for company in companies_in_batch:
         start_render_and_upload_if_not_exist(company.id, overwrite_conditions=False)
+    clear_batch_manager_cache()
 
     return jsonify({
         'status': 'ok',
@@ -674,74 +845,72 @@ def render_batch():
 @login_required
 def export_batch():
     """
-    Exports structured leads in a given batch as CSV, but only those whose associated Company 
+    Exports structured leads in a given batch as a CSV download, but only those whose associated Company 
     has a YouTube URL. Also tags exported leads with 'exported'.
+    Errors are returned as JSON.
     """
     data = request.json
     batch_tag = data.get('batch_tag')
     if not batch_tag:
         return jsonify({'status': 'error', 'message': 'No batch_tag provided'}), 400
 
-    # Get all structured leads whose tags include the batch_tag
-    leads_in_batch = (
-        db.session.query(StructuredLead)
-        .filter(StructuredLead.tags.contains(batch_tag))
-        .all()
-    )
-
-    if not leads_in_batch:
+    if db.session.scalar(select(LeadTag.id).where(LeadTag.tag == batch_tag).limit(1)) is None:
         return jsonify({'status': 'error', 'message': 'No leads found for that batch'}), 404
 
-    # Prepare CSV data
-    output = []
-    headers = ["First Name", "Last Name", "email", "YouTube URL", "Company Name", "Title"]
-    output.append(headers)
-
-    for lead in leads_in_batch:
-        # Retrieve the YouTube URL from the associated Company, if available
-        video_url = lead.company.custom_youtube_video if (lead.company and lead.company.custom_youtube_video) else ''
-        # Skip if there's no Video link:
-        if not video_url or not video_url.strip():
-            continue
-
-        row = [
-            lead.first_name or '',
-            lead.last_name or '',
-            lead.email or '',
-            video_url,
-            lead.company.name if (lead.company and lead.company.name) else '',
-            lead.title or ''
-        ]
-        output.append(row)
-
-        # Add 'exported' tag to the lead's tags if not already present
-        existing_tags = lead.tags or ''
-        tags_list = [t.strip() for t in existing_tags.split(',') if t.strip()] if existing_tags else []
-        if 'exported' not in tags_list:
-            tags_list.append('exported')
-            lead.tags = ','.join(tags_list)
-            db.session.add(lead)
-
-    db.session.commit()
+    # Only leads whose Company has a video link are exported
+    def select_exported_leads(*columns):
+        return (
+            select(*columns)
+            .select_from(StructuredLead)
+            .join(LeadTag)
+            .join(Company, Company.id == StructuredLead.company_id)
+            .where(LeadTag.tag == batch_tag,
+                   func.trim(func.coalesce(Company.custom_youtube_video, '')) != '')
+        )
 
-    if len(output) == 1:  # Only the header row exists, meaning no leads with a YouTube link were processed.
+    exported_leads = db.session.execute(select_exported_leads(StructuredLead.id, StructuredLead.tags)).all()
+    if not exported_leads:
         return jsonify({'status': 'error', 'message': 'No leads with a Video in this batch.'}), 400
 
-    # Create CSV file
-    import uuid
-    unique_filename = f"batch_export_{uuid.uuid4().hex}.csv"
-    final_path = os.path.join('output', unique_filename)
-    
-    # Ensure output directory exists
-    os.makedirs('output', exist_ok=True)
-
-    with open(final_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerows(output)
+    # Add the 'exported' tag to the leads that don't have it yet, in one UPDATE and one INSERT
+    exported_ids = [lead_id for lead_id, tags in exported_leads if 'exported' not in split_tags(tags)]
+    if exported_ids:
+        db.session.execute(
+            update(StructuredLead)
+            .where(StructuredLead.id.in_(exported_ids))
+            .values(tags=case(
+                (func.coalesce(StructuredLead.tags, '') == '', 'exported'),
+                else_=StructuredLead.tags + ',exported'
+            ))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(insert(LeadTag), [{'lead_id': lead_id, 'tag': 'exported'} for lead_id in exported_ids])
+    db.session.commit()
 
-    # Return download URL
-    download_url = url_for('serve_file', filename=unique_filename, _external=True)
-    return jsonify({'status': 'ok', 'download_url': download_url})
+    def rows():
+        yield ["First Name", "Last Name", "email", "YouTube URL", "Company Name", "Title"]
+        export_query = select_exported_leads(
+            StructuredLead.first_name, StructuredLead.last_name, StructuredLead.email,
+            Company.custom_youtube_video, Company.name, StructuredLead.title
+        ).order_by(StructuredLead.id).execution_options(yield_per=1000)
+        for row in db.session.execute(export_query):
+            yield [value or '' for value in row]
+
+    # Stream the CSV as the response, one row at a time through a small buffer
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for row in rows():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="Exported Leads.csv"'}
+    )
 
 @main_bp.route('/batch/delete', methods=['POST'])
 @login_required
@@ -757,62 +926,45 @@ def delete_batch():
         return jsonify({"status": "error", "message": "No batch tag provided"}), 400
     
     try:
-        # Find all leads with this batch tag
-        leads_in_batch = (
-            db.session.query(StructuredLead)
-            .filter(
-                StructuredLead.tags.isnot(None),
-                or_(
-                    StructuredLead.tags == batch_tag,
-                    StructuredLead.tags.like(f'{batch_tag},%'),
-                    StructuredLead.tags.like(f'%, {batch_tag},%'),
-                    StructuredLead.tags.like(f'%, {batch_tag}')
-                )
-            )
-            .all()
-        )
+        # Find all leads with this batch tag, only their ids are needed
+        leads_in_batch = db.session.execute(
+            select(StructuredLead.id, StructuredLead.company_id)
+            .join(LeadTag)
+            .where(LeadTag.tag == batch_tag)
+        ).all()
         
         # If no leads found with this batch tag
         if not leads_in_batch:
             return jsonify({"status": "error", "message": f"No leads found with batch tag '{batch_tag}'"}), 404
         
-        # Collect company IDs to be deleted
-        company_ids = []
-        for lead in leads_in_batch:
-            if lead.company_id and lead.company_id not in company_ids:
-                company_ids.append(lead.company_id)
+        lead_ids, company_ids = [], set()
+        for lead_id, company_id in leads_in_batch:
+            lead_ids.append(lead_id)
+            company_ids.add(company_id)
         
-        # Delete all tasks associated with these companies first to avoid foreign key constraints
-        for company_id in company_ids:
-            tasks = ProcessingTask.query.filter_by(company_id=company_id).all()
-            for task in tasks:
-                db.session.delete(task)
-        
-        # Delete all tasks associated with these leads
-        for lead in leads_in_batch:
-            tasks = ProcessingTask.query.filter_by(structured_lead_id=lead.id).all()
-            for task in tasks:
-                db.session.delete(task)
-        
-        # Delete the leads
+        # Delete the leads, the database cascades the DELETE to their tasks and tag rows
         lead_count = 0
-        for lead in leads_in_batch:
-            db.session.delete(lead)
-            lead_count += 1
+        for ids in chunked(lead_ids):
+            lead_count += db.session.execute(
+                delete(StructuredLead).where(StructuredLead.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            ).rowcount
         
-        # Delete the companies
+        # Delete the companies that have no leads left (not in this batch), along with their tasks
         company_count = 0
-        for company_id in company_ids:
-            company = Company.query.get(company_id)
-            if company:
-                # Check if the company still has any leads (not in this batch)
-                remaining_leads = StructuredLead.query.filter_by(company_id=company_id).count()
-                if remaining_leads == 0:  # Only delete if no leads remain
-                    db.session.delete(company)
-                    company_count += 1
+        for ids in chunked(company_ids):
+            company_count += db.session.execute(
+                delete(Company)
+                .where(
+                    Company.id.in_(ids),
+                    ~select(StructuredLead.id).where(StructuredLead.company_id == Company.id).exists(),
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
         
-        # Commit the changes
+        # The lookup and all DELETEs are one transaction, committed once
         db.session.commit()
+        clear_batch_manager_cache()
         
         return jsonify({
             "status": "ok", 
@@ -0,0 +1,51 @@
+"""ON DELETE CASCADE on the lead, company and task foreign keys
+
+Revision ID: 3c1f0a7d9b2e
+Revises:
+Create Date: 2026-10-15 23:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f0a7d9b2e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# create_all leaves the SQLite foreign keys unnamed, batch mode names them by this convention so they can be dropped
+NAMING_CONVENTION = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+# (table, column, referred table)
+CASCADE_FOREIGN_KEYS = (
+    ('processing_task', 'company_id', 'company'),
+    ('processing_task', 'structured_lead_id', 'structured_lead'),
+    ('lead_data', 'lead_id', 'lead'),
+    ('structured_lead', 'company_id', 'company'),
+    ('lead_tags', 'lead_id', 'structured_lead'),
+)
+
+
+def _recreate_foreign_keys(ondelete):
+    # SQLite rebuilds each table, this runs on the alembic.ini engine which leaves PRAGMA foreign_keys off,
+    # so dropping the old tables does not cascade
+    inspector = sa.inspect(op.get_bind())
+    for table, column, referred_table in CASCADE_FOREIGN_KEYS:
+        if not inspector.has_table(table):
+            continue  # lead_tags on databases from before it existed, b5d8e0f4a6c2 creates it with the CASCADE
+        name = f"fk_{table}_{column}_{referred_table}"
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred_table, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    _recreate_foreign_keys('CASCADE')
+
+
+def downgrade() -> None:
+    _recreate_foreign_keys(None)
@@ -0,0 +1,37 @@
+"""One value per lead field: de-duplicate lead_data and replace idx_lead_field with the unique uq_lead_field
+
+Revision ID: 7a4e2c91d5f3
+Revises: 3c1f0a7d9b2e
+Create Date: 2026-10-16 10:05:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4e2c91d5f3'
+down_revision = '3c1f0a7d9b2e'
+branch_labels = None
+depends_on = None
+
+# The older values of duplicated lead fields are moved here instead of being deleted,
+# downgrade() puts them back. Drop the table once the values are known to be unneeded.
+BACKUP_TABLE = 'lead_data_duplicates'
+
+
+def upgrade() -> None:
+    # Lead fields written before the unique index can be duplicated, keep the newest value of each
+    op.execute(
+        f"CREATE TABLE {BACKUP_TABLE} AS SELECT * FROM lead_data WHERE id NOT IN "
+        "(SELECT max(id) FROM lead_data GROUP BY lead_id, field_name)"
+    )
+    op.execute(f"DELETE FROM lead_data WHERE id IN (SELECT id FROM {BACKUP_TABLE})")
+    op.drop_index('idx_lead_field', table_name='lead_data', if_exists=True)
+    op.create_index('uq_lead_field', 'lead_data', ['lead_id', 'field_name'], unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_lead_field', table_name='lead_data')
+    op.execute(f"INSERT INTO lead_data SELECT * FROM {BACKUP_TABLE}")
+    op.drop_table(BACKUP_TABLE)
+    op.create_index('idx_lead_field', 'lead_data', ['lead_id', 'field_name'])
@@ -0,0 +1,26 @@
+"""Expression indexes for the case-insensitive lead duplicate checks
+
+Revision ID: 9c2d6b1f8a47
+Revises: e1f7a3b9c4d8
+Create Date: 2026-10-16 10:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2d6b1f8a47'
+down_revision = 'e1f7a3b9c4d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_lead_email_lower', 'structured_lead', [sa.text('lower(email)')], if_not_exists=True)
+    op.create_index('ix_lead_name_lower', 'structured_lead', [sa.text('lower(first_name)'), sa.text('lower(last_name)')], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_lead_name_lower', table_name='structured_lead')
+    op.drop_index('ix_lead_email_lower', table_name='structured_lead')
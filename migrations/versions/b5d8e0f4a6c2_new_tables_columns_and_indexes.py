@@ -0,0 +1,108 @@
+"""New tables, columns and indexes for lead tags, imports, the category cache, duplicate checks and task lookups
+
+Adds the lead_tags, import_batch_counter, import_issue and category_cache tables, company.normalized_url,
+server defaults on the task timestamps and the lookup indexes.
+
+Revision ID: b5d8e0f4a6c2
+Revises: 7a4e2c91d5f3
+Create Date: 2026-10-16 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d8e0f4a6c2'
+down_revision = '7a4e2c91d5f3'
+branch_labels = None
+depends_on = None
+
+# (table, column) added to existing tables, all nullable
+NEW_COLUMNS = (
+    ('company', sa.Column('normalized_url', sa.String(512))),
+)
+
+OPEN_TASK_STATUSES = "status IN ('pending', 'in_progress')"
+
+
+def _existing_columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # The tables may already exist where the app ran before this revision, its create_all adds missing tables
+    op.create_table(
+        'import_batch_counter',
+        sa.Column('day', sa.Date, primary_key=True),
+        sa.Column('imports', sa.Integer, nullable=False),
+        if_not_exists=True,
+    )
+    op.create_table(
+        'category_cache',
+        sa.Column('niche_category', sa.String(100), primary_key=True),
+        sa.Column('category', sa.String(100), nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        if_not_exists=True,
+    )
+    op.create_table(
+        'import_issue',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('filename', sa.String(255), nullable=False),
+        sa.Column('feedback', sa.Text, nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        if_not_exists=True,
+    )
+    op.create_index('ix_import_issue_user_id', 'import_issue', ['user_id'], if_not_exists=True)
+    op.create_table(
+        'lead_tags',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('lead_id', sa.Integer, sa.ForeignKey('structured_lead.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('tag', sa.String(255), nullable=False),
+        if_not_exists=True,
+    )
+    op.create_index('ix_tag_lead', 'lead_tags', ['tag', 'lead_id'], if_not_exists=True)
+
+    for table, column in NEW_COLUMNS:
+        if column.name not in _existing_columns(table):
+            op.add_column(table, column)
+
+    # Rebuilds the table on SQLite, the foreign keys keep the names 3c1f0a7d9b2e gave them. Reflection loses the
+    # WHERE and DESC of the task indexes, so any that already exist are dropped first and created again below.
+    for index_name in ('idx_task_pending', 'ix_task_lead_updated', 'ix_task_company_updated'):
+        op.drop_index(index_name, table_name='processing_task', if_exists=True)
+    with op.batch_alter_table('processing_task') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime, existing_nullable=False, server_default=sa.func.now())
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime, existing_nullable=False, server_default=sa.func.now())
+
+    op.create_index('ix_company_normalized_url', 'company', ['normalized_url'], if_not_exists=True)
+    # Fails if a user has the same Drive account connected twice, remove the extra drive_account rows first
+    op.create_index('uq_driveacct_user_email', 'drive_account', ['user_id', 'email'], unique=True, if_not_exists=True)
+    op.create_index('ix_export_templates_user_id', 'export_templates', ['user_id'], if_not_exists=True)
+    op.create_index('idx_task_pending', 'processing_task', ['task_type', 'updated_at'],
+                    sqlite_where=sa.text(OPEN_TASK_STATUSES), postgresql_where=sa.text(OPEN_TASK_STATUSES), if_not_exists=True)
+    op.create_index('ix_task_lead_updated', 'processing_task', ['structured_lead_id', sa.text('updated_at DESC')], if_not_exists=True)
+    op.create_index('ix_task_company_updated', 'processing_task', ['company_id', sa.text('updated_at DESC')], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_company_updated', table_name='processing_task')
+    op.drop_index('ix_task_lead_updated', table_name='processing_task')
+    op.drop_index('idx_task_pending', table_name='processing_task')
+    op.drop_index('ix_export_templates_user_id', table_name='export_templates')
+    op.drop_index('uq_driveacct_user_email', table_name='drive_account')
+    op.drop_index('ix_company_normalized_url', table_name='company')
+
+    with op.batch_alter_table('processing_task') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime, existing_nullable=False, server_default=None)
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime, existing_nullable=False, server_default=None)
+
+    for table, column in reversed(NEW_COLUMNS):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(column.name)
+
+    op.drop_table('lead_tags')
+    op.drop_table('import_issue')
+    op.drop_table('category_cache')
+    op.drop_table('import_batch_counter')
@@ -0,0 +1,31 @@
+"""Client side insert sentinel columns, for multi-row INSERT ... RETURNING of companies, leads and lead tags
+
+Revision ID: d3a8f5c2e9b1
+Revises: 9c2d6b1f8a47
+Create Date: 2026-10-16 11:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a8f5c2e9b1'
+down_revision = '9c2d6b1f8a47'
+branch_labels = None
+depends_on = None
+
+# Nullable and never written by the database, the ORM fills it per INSERT
+SENTINEL_TABLES = ('company', 'structured_lead', 'lead_tags')
+
+
+def upgrade() -> None:
+    for table in SENTINEL_TABLES:
+        if '_sentinel' not in {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}:
+            op.add_column(table, sa.Column('_sentinel', sa.Integer))
+
+
+def downgrade() -> None:
+    # A plain DROP COLUMN (SQLite 3.35+), a batch table rebuild would lose the lower() expression indexes of structured_lead
+    for table in reversed(SENTINEL_TABLES):
+        op.drop_column(table, '_sentinel')
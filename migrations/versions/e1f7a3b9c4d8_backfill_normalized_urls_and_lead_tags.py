@@ -0,0 +1,69 @@
+"""Backfill company.normalized_url and lead_tags for rows created before they existed
+
+Revision ID: e1f7a3b9c4d8
+Revises: b5d8e0f4a6c2
+Create Date: 2026-10-16 10:35:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from models import Company, split_tags
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f7a3b9c4d8'
+down_revision = 'b5d8e0f4a6c2'
+branch_labels = None
+depends_on = None
+
+company = sa.table(
+    'company',
+    sa.column('id', sa.Integer),
+    sa.column('website_url', sa.String),
+    sa.column('normalized_url', sa.String),
+)
+structured_lead = sa.table(
+    'structured_lead',
+    sa.column('id', sa.Integer),
+    sa.column('tags', sa.Text),
+)
+lead_tags = sa.table(
+    'lead_tags',
+    sa.column('lead_id', sa.Integer),
+    sa.column('tag', sa.String),
+)
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    # Same normalization as Company's website_url validator, updated_at is left alone
+    unnormalized = connection.execute(
+        sa.select(company.c.id, company.c.website_url)
+        .where(company.c.normalized_url.is_(None), company.c.website_url.isnot(None))
+    ).all()
+    if unnormalized:
+        connection.execute(
+            company.update().where(company.c.id == sa.bindparam('company_id')).values(normalized_url=sa.bindparam('normalized')),
+            [{'company_id': company_id, 'normalized': Company.normalize_website_url(website_url)}
+             for company_id, website_url in unnormalized]
+        )
+
+    # One row per tag of the leads' comma separated tags, for leads that have no lead_tags rows yet
+    tagged_lead_ids = sa.select(lead_tags.c.lead_id)
+    tag_rows = [
+        {'lead_id': lead_id, 'tag': tag}
+        for lead_id, tags in connection.execute(
+            sa.select(structured_lead.c.id, structured_lead.c.tags)
+            .where(structured_lead.c.tags.isnot(None), structured_lead.c.id.not_in(tagged_lead_ids))
+        )
+        for tag in split_tags(tags)
+    ]
+    if tag_rows:
+        connection.execute(lead_tags.insert(), tag_rows)
+
+
+def downgrade() -> None:
+    # Derived data, the columns and tables it lives in are dropped by the previous revision's downgrade
+    pass
@@ -1,13 +1,18 @@
 from typing import Optional
+import asyncio
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
 import json
 from contextlib import contextmanager
+import os
 import re
-from sqlalchemy.orm import validates
-from sqlalchemy import func, or_
+from sqlalchemy.orm import validates, selectinload
+from sqlalchemy import func, event, inspect, select, insert_sentinel
+from sqlalchemy.dialects import postgresql, sqlite
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from utils.ai_prompts import create_prompt_for_loading_data
 from utils.ai_basic_functions import run_prompt_with_gemini, run_prompt_with_gemini_async
 
@@ -32,6 +37,24 @@ def get_session():
     finally:
         session.close()
 
+# insert() with the ON CONFLICT clauses (on_conflict_do_update / on_conflict_do_nothing) per dialect
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def upsert_insert(table):
+    """
+    Returns an INSERT into table that supports ON CONFLICT upserts, for the dialect of the app's database.
+
+    Args:
+        table: Model class or Table to insert into
+
+    Returns:
+        Insert: The dialect's insert(table)
+    """
+    dialect_name = db.engine.dialect.name
+    if dialect_name not in _UPSERT_INSERTS:
+        raise NotImplementedError(f"ON CONFLICT inserts are not supported on {dialect_name}")
+    return _UPSERT_INSERTS[dialect_name](table)
+
 class User(UserMixin, db.Model):
     """User model for authentication."""
     id = db.Column(db.Integer, primary_key=True)
@@ -42,7 +65,8 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(50), nullable=False, default="uploader")
     
     # One-to-many relationship with DriveAccount
-    drive_accounts = db.relationship('DriveAccount', backref='user', lazy=True)
+    # Loaded on access, eager loading here would add a query to every request that loads the current user
+    drive_accounts = db.relationship('DriveAccount', back_populates='user', lazy=True)
 
     def set_password(self, password):
         """Set the user's password."""
@@ -74,6 +98,12 @@ class DriveAccount(db.Model):
     token_expiry = db.Column(db.DateTime)
     needs_reauth = db.Column(db.Boolean, default=False)
 
+    user = db.relationship('User', back_populates='drive_accounts', lazy='selectin')
+
+    __table_args__ = (
+        db.Index('uq_driveacct_user_email', user_id, email, unique=True),  # One row per connected account and user
+    )
+
     def __repr__(self):
         return f'<DriveAccount {self.email}>'
 
@@ -121,7 +151,7 @@ class Lead(db.Model):
     source = db.Column(db.String(50), nullable=False)  # e.g., 'csv_import', 'manual', 'api'
     
     # Relationships
-    data = db.relationship('LeadData', backref='lead', lazy=True, cascade='all, delete-orphan')
+    data = db.relationship('LeadData', backref='lead', lazy='selectin', cascade='all, delete-orphan', passive_deletes=True)
 
     def get_data(self, field_name):
         """Get the value of a specific field."""
@@ -129,23 +159,32 @@ class Lead(db.Model):
         return data_entry.field_value if data_entry else None
 
     def set_data(self, field_name, value, is_enriched=False, enrichment_source=None):
-        """Set or update a field value."""
-        data_entry = LeadData.query.filter_by(lead_id=self.id, field_name=field_name).first()
-        if data_entry:
-            data_entry.field_value = value
-            data_entry.is_enriched = is_enriched
-            data_entry.enrichment_source = enrichment_source
-        else:
-            data_entry = LeadData(
-                lead_id=self.id,
-                field_name=field_name,
-                field_value=value,
-                is_enriched=is_enriched,
-                enrichment_source=enrichment_source
-            )
-            db.session.add(data_entry)
+        """Set or update a field value. The caller commits."""
+        self.set_data_bulk({field_name: value}, is_enriched=is_enriched, enrichment_source=enrichment_source)
+
+    def set_data_bulk(self, fields, is_enriched=False, enrichment_source=None):
+        """
+        Set or update several field values with one upsert.
+        Doesn't commit, callers commit once for all their writes, e.g. by wrapping them in `get_session()`.
+
+        Args:
+            fields (dict): Field name -> value
+            is_enriched (bool): Whether the values come from an enrichment
+            enrichment_source (str, optional): Where the enriched values come from
+        """
+        if not fields:
+            return
+        LeadData.upsert([
+            {
+                'lead_id': self.id,
+                'field_name': field_name,
+                'field_value': value,
+                'is_enriched': is_enriched,
+                'enrichment_source': enrichment_source,
+            }
+            for field_name, value in fields.items()
+        ])
         self.updated_at = utc_now()
-        db.session.commit()
 
     def to_dict(self):
         """Convert lead to dictionary including all data."""
@@ -163,7 +202,7 @@ class Lead(db.Model):
 class LeadData(db.Model):
     """Flexible data storage for lead fields."""
     id = db.Column(db.Integer, primary_key=True)
-    lead_id = db.Column(db.Integer, db.ForeignKey('lead.id'), nullable=False)
+    lead_id = db.Column(db.Integer, db.ForeignKey('lead.id', ondelete='CASCADE'), nullable=False)
     field_name = db.Column(db.String(100), nullable=False)
     field_value = db.Column(db.Text)
     is_enriched = db.Column(db.Boolean, default=False)
@@ -171,9 +210,32 @@ class LeadData(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=utc_now, onupdate=utc_now)
 
     __table_args__ = (
-        db.Index('idx_lead_field', lead_id, field_name),  # Index for faster field lookups
+        # Index for faster field lookups, unique so there is one value per lead field to upsert
+        db.Index('uq_lead_field', lead_id, field_name, unique=True),
     )
 
+    @staticmethod
+    def upsert(rows):
+        """
+        Inserts lead field values with one INSERT ... ON CONFLICT DO UPDATE, overwriting existing values of the same lead field.
+        Bulk statement, so `Lead.data` collections already loaded in the session are not refreshed.
+
+        Args:
+            rows (list[dict]): Dicts with lead_id, field_name, field_value and optionally is_enriched and enrichment_source
+        """
+        now = utc_now()
+        rows = [{'is_enriched': False, 'enrichment_source': None, **row, 'updated_at': now} for row in rows]
+        stmt = upsert_insert(LeadData).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['lead_id', 'field_name'],
+            set_={
+                'field_value': stmt.excluded.field_value,
+                'is_enriched': stmt.excluded.is_enriched,
+                'enrichment_source': stmt.excluded.enrichment_source,
+                'updated_at': stmt.excluded.updated_at,
+            },
+        ))
+
     def dict(self):
         return {
             'id': self.id,
@@ -188,18 +250,30 @@ class LeadData(db.Model):
 class ProcessingTask(db.Model):
     """Model for tracking processing tasks (video rendering, enrichments, etc.)."""
     id = db.Column(db.Integer, primary_key=True)
-    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=True)
-    structured_lead_id = db.Column(db.Integer, db.ForeignKey('structured_lead.id'), nullable=True)
+    # Tasks go with their company / lead, the database cascades the DELETE
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id', ondelete='CASCADE'), nullable=True)
+    structured_lead_id = db.Column(db.Integer, db.ForeignKey('structured_lead.id', ondelete='CASCADE'), nullable=True)
     task_type = db.Column(db.String(50), nullable=False)  # e.g., 'video_render', 'email_find'
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, in_progress, completed, failed
     instance_id = db.Column(db.String(36))  # UUID of processing instance
-    created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
-    updated_at = db.Column(db.DateTime, nullable=False, default=utc_now, onupdate=utc_now)
+    # server_default covers rows inserted outside the ORM
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now, server_default=func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, default=utc_now, server_default=func.now(), onupdate=utc_now)
     result_data = db.Column(db.Text)  # JSON string for task-specific data
 
+    __table_args__ = (
+        # Partial index over the open work set only, used by the workers polling for the next task
+        db.Index('idx_task_pending', task_type, updated_at,
+                 sqlite_where=status.in_(['pending', 'in_progress']),
+                 postgresql_where=status.in_(['pending', 'in_progress'])),
+        # Latest task of a lead / company, e.g. for the leads overview
+        db.Index('ix_task_lead_updated', structured_lead_id, updated_at.desc()),
+        db.Index('ix_task_company_updated', company_id, updated_at.desc()),
+    )
+
     # Relationships
-    company = db.relationship('Company', backref='tasks', lazy=True)
-    structured_lead = db.relationship('StructuredLead', backref='tasks', lazy=True)
+    company = db.relationship('Company', backref=db.backref('tasks', passive_deletes=True), lazy=True)
+    structured_lead = db.relationship('StructuredLead', backref=db.backref('tasks', passive_deletes=True), lazy=True)
 
     def set_result_data(self, data):
         """Set result data as JSON."""
@@ -224,6 +298,66 @@ class ProcessingTask(db.Model):
     def dict(self):
         return self.to_dict()
 
+class ImportBatchCounter(db.Model):
+    """Number of CSV imports started per day, used to number the 'import-batch DD-MM-YYYY/N' tags."""
+    day = db.Column(db.Date, primary_key=True)
+    imports = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ImportBatchCounter {self.day}: {self.imports}>'
+
+class ImportIssue(db.Model):
+    """Problems found in an uploaded CSV by the background pre-check, shown to the uploader on the upload page."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    feedback = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+
+    def __repr__(self):
+        return f'<ImportIssue {self.filename}>'
+
+def split_tags(tags: Optional[str]) -> list[str]:
+    """
+    Splits a comma separated tags string into its unique, stripped tags (in order).
+
+    Args:
+        tags: Tags string like 'tag1, tag2' or None
+
+    Returns:
+        list[str]: The individual tags
+    """
+    if not tags:
+        return []
+    return list(dict.fromkeys(tag.strip() for tag in tags.split(',') if tag.strip()))
+
+class LeadTag(db.Model):
+    """
+    One row per (lead, tag), kept in sync with StructuredLead.tags.
+    Lets batch lookups use an index instead of LIKE scans over the comma separated tags column.
+    """
+    __tablename__ = 'lead_tags'
+    __table_args__ = (
+        db.Index('ix_tag_lead', 'tag', 'lead_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    lead_id = db.Column(db.Integer, db.ForeignKey('structured_lead.id', ondelete='CASCADE'), nullable=False)
+    tag = db.Column(db.String(255), nullable=False)
+    # Batches the INSERTs of the tag rows of new leads, see Company._sentinel
+    _sentinel = insert_sentinel('_sentinel', db.Integer)
+
+    def __repr__(self):
+        return f'<LeadTag {self.lead_id}: {self.tag}>'
+
+class CategoryCache(db.Model):
+    """Caches the video config category the LLM picked for a niche, so each niche is only categorized once."""
+    niche_category = db.Column(db.String(100), primary_key=True)
+    category = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+
+    def __repr__(self):
+        return f'<CategoryCache {self.niche_category} -> {self.category}>'
+
 class ExportTemplate(db.Model):
     """
     Model representing a user's export template.
@@ -231,16 +365,17 @@ class ExportTemplate(db.Model):
     :param id: Primary key
     :param user_id: Foreign key to the user who owns this template
     :param name: Human-friendly name of the template
-    :param columns_json: JSON string storing an array of field names that the user wants to export
+    :param columns: Array of field names that the user wants to export, stored as JSON
     :param created_at: When the template was created
     :param updated_at: When the template was last updated
     """
     __tablename__ = "export_templates"
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     name = db.Column(db.String(200), nullable=False)
-    columns_json = db.Column(db.Text, nullable=False, default='[]')
+    # JSON column over the existing columns_json TEXT column, stored values are already JSON arrays
+    columns = db.Column('columns_json', db.JSON, nullable=False, default=list)
     created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
     updated_at = db.Column(db.DateTime, nullable=False, default=utc_now, onupdate=utc_now)
 
@@ -248,8 +383,8 @@ class ExportTemplate(db.Model):
     user = db.relationship('User', backref='export_templates', lazy=True)
 
     def get_columns(self) -> list[str]:
-        """Return the list of columns from the stored JSON."""
-        return json.loads(self.columns_json)
+        """Return the list of columns."""
+        return self.columns
 
     def set_columns(self, columns: list[str]) -> None:
         """
@@ -257,7 +392,7 @@ class ExportTemplate(db.Model):
         
         :param columns: A list of strings representing field names
         """
-        self.columns_json = json.dumps(columns)
+        self.columns = list(columns)
 
     def dict(self):
         return {
@@ -269,11 +404,16 @@ class ExportTemplate(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+# Parts of a website URL that normalize_website_url drops
+_URL_NORMALIZE_RE = re.compile(r"www\.|https?|[/:]")
+
 class Company(db.Model):
     """Company model containing company information."""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     website_url = db.Column(db.String(512), nullable=False)
+    # normalize_website_url(website_url), kept in sync by _set_normalized_url, indexed for duplicate lookups
+    normalized_url = db.Column(db.String(512), index=True)
     niche_category = db.Column(db.String(100), nullable=False)
     is_running_ads = db.Column(db.Boolean, nullable=False, default=False)
     ads_url = db.Column(db.String(512))
@@ -281,13 +421,21 @@ class Company(db.Model):
     tags = db.Column(db.Text)
     created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
     updated_at = db.Column(db.DateTime, nullable=False, default=utc_now, onupdate=utc_now)
+    # SQLite returns no ordered RETURNING rows for autoincrement ids, this client side sentinel lets a flush of
+    # many new companies go out as multi-row INSERT ... RETURNING instead of one INSERT per company
+    _sentinel = insert_sentinel('_sentinel', db.Integer)
     
     # Relationships
-    leads = db.relationship('StructuredLead', backref='company', lazy=True)
+    leads = db.relationship('StructuredLead', backref='company', lazy=True, passive_deletes=True)
     
     def __repr__(self):
         return f'<Company {self.name}>'
 
+    @validates('website_url')
+    def _set_normalized_url(self, key, website_url):
+        self.normalized_url = Company.normalize_website_url(website_url) if website_url is not None else None
+        return website_url
+
     def load_using_ai(self, input_data: str):
         output_rules = """- name: Title Case (not nullable; if not provided, use 'Unknown') 
 - website_url: valid url (not nullable; if not provided, use 'Unknown')
@@ -362,7 +510,40 @@ Notes: in the niche things like 'blue collar', 'BC', 'coding bootcamp' are 'skil
         await company.load_using_ai_async(input_data)
         return company
     
+    @staticmethod
+    def normalize_website_url(website_url: str) -> str:
+        """Normalizes a website URL for duplicate matching: drops 'www.', the scheme, '/' and ':' and lowercases it."""
+        return _URL_NORMALIZE_RE.sub("", website_url).lower()
+
+    @staticmethod
+    def base_website_url(website_url: str) -> str:
+        """Returns the host of a website URL, without scheme, path, query or port."""
+        if website_url.startswith("http://") or website_url.startswith("https://"):
+            return website_url.split("/")[2].split("?")[0].split(":")[0].split("#")[0]
+        return website_url.split("/")[0].split("?")[0].split(":")[0].split("#")[0]
+
+    @staticmethod
+    def url_match_keys(website_url: str) -> set[str]:
+        """
+        Keys under which another company with this website URL is a certain duplicate: the URL itself
+        and its normalized form. Used to look up duplicates in bulk. A base URL match is only a possible
+        duplicate, look_for_duplicate_async has Gemini confirm those.
+        """
+        keys = {website_url, Company.normalize_website_url(website_url)}
+        keys.discard("")
+        return keys
+
     def look_for_duplicate(self) -> Optional['Company']:
+        """
+        Sync version of look_for_duplicate_async.
+        Look for a possible duplicate company in the database.
+
+        Returns:
+            Company: The duplicate Company object if found, otherwise None.
+        """
+        return asyncio.run(self.look_for_duplicate_async())
+
+    async def look_for_duplicate_async(self) -> Optional['Company']:
         """
         Look for a possible duplicate company in the database.
 
@@ -377,40 +558,31 @@ Notes: in the niche things like 'blue collar', 'BC', 'coding bootcamp' are 'skil
         print(self.website_url)
         if not self.website_url:
             return None
-        # 1. Check for exact match on website_url
-        exact_duplicate = Company.query.filter(Company.website_url == self.website_url, Company.id != self.id).first()
-        if exact_duplicate:
-            return exact_duplicate
-
-        # 2. Check for normalized URL match
-        normalized_url = self.website_url.replace("www.", "").replace("https", "http").replace("http", "").replace("/", "").replace(":", "").lower() if self.website_url else None
-        if normalized_url:
-            # Query using normalized URL comparison
+        # 1. + 2. Exact or normalized URL match, one lookup on the normalized_url index that prefers an exact match
+        if self.normalized_url:
             duplicate = Company.query.filter(
                 Company.id != self.id,
-                func.lower(func.replace(func.replace(func.replace(func.replace(func.replace(Company.website_url, 'www.', ''), "http", ""), 'https', 'http'), '/', ''), ':', '')) == normalized_url
-            ).first()
+                Company.normalized_url == self.normalized_url
+            ).order_by((Company.website_url == self.website_url).desc()).first()
             if duplicate:
                 return duplicate
         
         # 3. Check for base_url match
-        if self.website_url.startswith("http://") or self.website_url.startswith("https://"):
-            base_url = self.website_url.split("/")[2].split("?")[0].split(":")[0].split("#")[0]
-        else:
-            base_url = self.website_url.split("/")[0].split("?")[0].split(":")[0].split("#")[0]
+        base_url = Company.base_website_url(self.website_url)
 
         if len(base_url) < 3:
             return None  # Parsing failed
 
         duplicates = Company.query.filter(
             Company.id != self.id,
-            func.lower(func.substr(Company.website_url, 1, len(base_url) + 10)) == base_url.lower()
+            Company.normalized_url == Company.normalize_website_url(base_url)
         ).all()
         if len(duplicates) > 0:
             print("base url match found, checking for duplicates. original url: ", self.website_url, "base url: ", base_url, "example duplicate url: ", duplicates[0].website_url)
             if len(duplicates) > 5:
                 print('Too many duplicates, limiting to 5. base_url: ', base_url, 'total duplicates: ', len(duplicates))
                 duplicates = duplicates[:5]
+            prompts = []
             for duplicate in duplicates:
                 prompt = f"""
                 Are these two company records representing the same actual company?
@@ -436,8 +608,11 @@ Notes: in the niche things like 'blue collar', 'BC', 'coding bootcamp' are 'skil
                 Example output:
                 {{"same_company": true, "confidence": 0.95, "reason": "The websites and company names are almost identical, with only minor differences in formatting and content and company name. rest is identical."}}
                 """
-                
-                response = run_prompt_with_gemini(prompt=prompt)
+                prompts.append(prompt)
+
+            # Ask about all candidates at once, the first confirmed one in candidate order wins
+            responses = await asyncio.gather(*(run_prompt_with_gemini_async(prompt=prompt) for prompt in prompts))
+            for duplicate, response in zip(duplicates, responses):
                 try:
                     result = json.loads(response.strip(" \n`json"))
                     if result.get('same_company', False) and result.get('confidence', 0) >= 0.7:
@@ -464,20 +639,34 @@ Notes: in the niche things like 'blue collar', 'BC', 'coding bootcamp' are 'skil
 
 class StructuredLead(db.Model):
     """Structured lead model with direct field access."""
+    __table_args__ = (
+        # Duplicate checks compare case-insensitively, expression indexes let them use lower(...) = ? lookups
+        db.Index('ix_lead_email_lower', func.lower(db.column('email'))),
+        db.Index('ix_lead_name_lower', func.lower(db.column('first_name')), func.lower(db.column('last_name'))),
+    )
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
     title = db.Column(db.String(100))
     email = db.Column(db.String(255), nullable=False, unique=True)
     phone = db.Column(db.String(50))
-    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id', ondelete='CASCADE'), nullable=False)
     linkedin_url = db.Column(db.String(512))
     tags = db.Column(db.Text)
     created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
     updated_at = db.Column(db.DateTime, nullable=False, default=utc_now, onupdate=utc_now)
+    tag_rows = db.relationship('LeadTag', cascade='all, delete-orphan', lazy=True, passive_deletes=True)
+    # Batches the INSERTs of new leads, see Company._sentinel
+    _sentinel = insert_sentinel('_sentinel', db.Integer)
     
     def __repr__(self):
         return f'<Lead {self.first_name} {self.last_name}>'
+
+    @validates('tags')
+    def _sync_tag_rows(self, key, tags):
+        # Keep the lead_tags rows in step with the tags string
+        self.tag_rows = [LeadTag(tag=tag) for tag in split_tags(tags)]
+        return tags
     
     def load_using_ai(self, input_data: str):
         output_rules = """- first_name: Title Case (not nullable; if not provided, use 'Unknown')
@@ -553,21 +742,24 @@ class StructuredLead(db.Model):
             Returns None if no duplicates are found.
         """
         if not any([self.first_name, self.last_name, self.email]):
-            return []  # Not enough information to find duplicates
-
-        # Build the query dynamically
-        duplicates_query = db.session.query(StructuredLead).filter(
-            StructuredLead.id != self.id,  # Exclude the current lead itself
-            or_(
-                (func.lower(StructuredLead.first_name) == func.lower(self.first_name)) &
-                (func.lower(StructuredLead.last_name) == func.lower(self.last_name)) if self.first_name and self.last_name else False,
-                func.lower(StructuredLead.email) == func.lower(self.email) if self.email else False,
-            )
-        )
+            return None  # Not enough information to find duplicates
 
-        # Execute the query and return the results
-        potential_duplicate = duplicates_query.first()
-        return potential_duplicate
+        # Two lookups on the lower(...) expression indexes instead of one OR over both, email first as it is the most selective
+        if self.email:
+            potential_duplicate = db.session.query(StructuredLead).filter(
+                StructuredLead.id != self.id,  # Exclude the current lead itself
+                func.lower(StructuredLead.email) == func.lower(self.email),
+            ).first()
+            if potential_duplicate:
+                return potential_duplicate
+
+        if self.first_name and self.last_name:
+            return db.session.query(StructuredLead).filter(
+                StructuredLead.id != self.id,
+                func.lower(StructuredLead.first_name) == func.lower(self.first_name),
+                func.lower(StructuredLead.last_name) == func.lower(self.last_name),
+            ).first()
+        return None
 
     def dict(self):
         return {
@@ -598,14 +790,80 @@ class StructuredLead(db.Model):
             lead_dict.update(prefixed_company_dict)  # Merge into lead_dict
         return lead_dict
 
+    @classmethod
+    def stream_with_company(cls, *criteria, batch_size=1000):
+        """
+        Yields `dict_with_company()` of the leads matching the criteria, loaded batch_size leads at a time
+        (with their companies in one query per batch) so exports don't hold every lead in memory.
+
+        Usage:
+            for row in StructuredLead.stream_with_company(StructuredLead.id.in_(lead_ids)):
+                writer.writerow(...)
+
+        Args:
+            *criteria: WHERE clauses, all leads if none are given
+            batch_size (int): Leads loaded per batch
+
+        Yields:
+            dict: The lead with its company fields prefixed with "company_"
+        """
+        stmt = (
+            select(cls)
+            .where(*criteria)
+            .order_by(cls.id)
+            .options(selectinload(cls.company))
+            .execution_options(yield_per=batch_size)
+        )
+        for lead in db.session.execute(stmt).scalars():
+            yield lead.dict_with_company()
+
+# Applied to every new SQLite connection. WAL lets the routes read while a CSV import or worker writes,
+# with WAL synchronous=NORMAL only syncs at checkpoints and can't corrupt the database.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256MB
+    "PRAGMA cache_size=-64000",  # 64MB page cache per connection
+    "PRAGMA foreign_keys=ON",  # SQLite only enforces foreign keys, and their ON DELETE CASCADE, when enabled
+)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+# Alembic revisions, upgrade an existing database with `alembic -c migrations/alembic.ini upgrade head`
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+def _check_schema_revision(is_new_database):
+    """
+    Makes sure the database is at the latest Alembic revision. The code relies on the migrated schema,
+    e.g. delete_batch on the ON DELETE CASCADE foreign keys, which create_all doesn't add to existing tables.
+    A database create_all just built from scratch already has the latest schema and is stamped with it.
+    """
+    script = ScriptDirectory(MIGRATIONS_DIR)
+    with db.engine.begin() as connection:
+        context = MigrationContext.configure(connection)
+        if is_new_database:
+            context.stamp(script, 'head')
+        elif set(context.get_current_heads()) != set(script.get_heads()):
+            raise RuntimeError(
+                f"Database is at revision {', '.join(context.get_current_heads()) or 'none'}, "
+                f"the code needs {', '.join(script.get_heads())}. "
+                "Run `alembic -c migrations/alembic.ini upgrade head` before starting the app."
+            )
+
 def init_db(app):
     """Initialize the database and create tables."""
     db.init_app(app)
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+        is_new_database = not inspect(db.engine).get_table_names()
         db.create_all()
-        
-        
-        db.session.commit()
+        _check_schema_revision(is_new_database)
 
 def create_user(username, email, password, role='uploader'):
     """Create a new user."""
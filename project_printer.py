@@ -1,35 +1,117 @@
+import io
 import os
-
-
-def unified_sort(items, path):
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# A whole `# project_printer:ignore_start` / `# project_printer:ignore_end` line, whitespace around the marker
+# allowed like line.strip() did
+_IGNORE_MARKER_RE = re.compile(r"^[^\S\n]*# project_printer:ignore_(start|end)[^\S\n]*(?:\n|\Z)", re.MULTILINE)
+# Files whose content is printed, by extension or by name
+_PRINTED_EXTENSIONS = frozenset({"py", "md", "html", "css", "js"})
+_PRINTED_FILE_NAMES = frozenset({".gitignore", "requirements.txt", ".env"})
+# Source files are read in 1MB chunks instead of the default 8KB
+READ_BUFFER_SIZE = 1 << 20
+# Threads scanning directories concurrently in scan_tree, scandir releases the GIL while it waits on the filesystem
+SCAN_WORKERS = 8
+# Processed file content by absolute path, with the file's mtime and size when it was read, so repeated runs
+# in the same process (e.g. the coding agent calling main() in a loop) only re-read files that changed
+_CONTENT_CACHE: dict[str, tuple[int, int, str]] = {}
+
+
+def unified_sort_entries(entries):
     """
-    Sorts items with directories first, then alphabetically.
+    Sorts directory entries with directories first, then alphabetically by name.
+    Uses the file type cached on the os.DirEntry objects, so no extra stat call per entry.
 
     Args:
-        items: A list of file and directory names.
-        path: The path to the directory containing these items.
+        entries: An iterable of os.DirEntry objects, e.g. from os.scandir.
 
     Returns:
-        A new list with items sorted as per the requirements.
+        A new list with the entries sorted as per the requirements.
     """
     
     dirs = []
     files = []
-    for item in items:
-        item_path = os.path.join(path, item)
-        if os.path.isdir(item_path):
-            dirs.append(item)
+    for entry in entries:
+        if entry.is_dir():
+            dirs.append(entry)
         else:
-            files.append(item)
+            files.append(entry)
     
-    dirs.sort()
-    files.sort()
+    dirs.sort(key=lambda entry: entry.name)
+    files.sort(key=lambda entry: entry.name)
 
     return dirs + files
 
 
 
-def display_project_structure(path, project_root, ignored_items=None, indent="", structure_string=""):
+def list_directory(path, ignored_items, tree=None):
+    """
+    Returns the sorted entries of a directory, without ignored and hidden items (except .gitignore and .env).
+
+    Args:
+        path: The path to the directory.
+        ignored_items: A list of items (files or directories) to ignore.
+        tree: Optional dict caching the entries by directory path, so a second walk over the same
+            tree reuses the first walk's results instead of scanning the directories again.
+
+    Returns:
+        A list of os.DirEntry objects, directories first.
+
+    Raises:
+        PermissionError: If the directory can't be read.
+    """
+    if tree is not None and path in tree:
+        return tree[path]
+
+    with os.scandir(path) as it:
+        entries = [
+            entry
+            for entry in it
+            if entry.name not in ignored_items and (not entry.name.startswith(".") or entry.name == ".gitignore" or entry.name == ".env")
+        ]
+    entries = unified_sort_entries(entries)
+
+    if tree is not None:
+        tree[path] = entries
+    return entries
+
+def scan_tree(path, ignored_items, max_workers=SCAN_WORKERS):
+    """
+    Scans path and all its subdirectories with a pool of threads and returns the entries cache
+    for list_directory, so walking the tree afterwards needs no further directory scans.
+    Directories that can't be read are left out, the walks then report them when scanning them again.
+
+    Args:
+        path: The path to the root directory.
+        ignored_items: A list of items (files or directories) to ignore.
+        max_workers: The number of threads scanning directories.
+
+    Returns:
+        A dict of directory path -> sorted list of os.DirEntry objects.
+    """
+    tree = {}
+
+    def scan(directory):
+        try:
+            return directory, list_directory(directory, ignored_items)
+        except OSError:
+            return directory, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(scan, path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory, entries = future.result()
+                if entries is None:
+                    continue
+                tree[directory] = entries
+                pending.update(executor.submit(scan, entry.path) for entry in entries if entry.is_dir())
+    return tree
+
+def display_project_structure(path, project_root, ignored_items=None, indent="", structure_string="", tree=None):
     """
     Displays the project structure in a terminal-like tree format,
     respecting the ignored items, and returns the structure as a string.
@@ -38,8 +120,9 @@ def display_project_structure(path, project_root, ignored_items=None, indent="",
         path: The path to the directory you want to display the structure for.
         project_root: The root path of the project.
         ignored_items: A list of items (files or directories) to ignore.
-        indent: The current indentation level (used for recursion).
-        structure_string: The string accumulating the structure (used for recursion).
+        indent: The indentation to start with.
+        structure_string: A string to prepend to the structure.
+        tree: Optional directory entries cache, see list_directory.
 
     Returns:
         The project structure as a formatted string.
@@ -47,26 +130,35 @@ def display_project_structure(path, project_root, ignored_items=None, indent="",
     if ignored_items is None:
         ignored_items = []
 
+    # Collect the lines in a list and join once, += on the growing string would copy it for every line
+    lines = [structure_string]
+    _walk_project_structure(path, ignored_items, indent, lines, tree)
+    return "".join(lines)
+
+def _walk_project_structure(path, ignored_items, indent, lines, tree):
+    """
+    Appends the tree lines of path to lines, recursing into subdirectories.
+
+    Args:
+        path: The path to the file or directory.
+        ignored_items: A list of items (files or directories) to ignore.
+        indent: The current indentation level.
+        lines: The list the lines are appended to.
+        tree: Optional directory entries cache, see list_directory.
+    """
     if os.path.isfile(path):
-        structure_string += indent + os.path.basename(path) + "\n"
-        return structure_string
+        lines.append(indent + os.path.basename(path) + "\n")
+        return
 
     try:
-        items = os.listdir(path)
+        entries = list_directory(path, ignored_items, tree)
     except PermissionError:
-        structure_string += indent + "└── [Permission Denied]\n"
-        return structure_string
-
-    items = [
-        item
-        for item in items
-        if item not in ignored_items and (not item.startswith(".") or item == ".gitignore" or item == ".env")
-    ]
-    items = unified_sort(items, path)
+        lines.append(indent + "└── [Permission Denied]\n")
+        return
 
-    for i, item in enumerate(items):
-        item_path = os.path.join(path, item)
-        is_last_item = i == len(items) - 1
+    for i, entry in enumerate(entries):
+        item = entry.name
+        is_last_item = i == len(entries) - 1
 
         if is_last_item:
             prefix = indent + "└── "
@@ -75,51 +167,64 @@ def display_project_structure(path, project_root, ignored_items=None, indent="",
             prefix = indent + "├── "
             new_indent = indent + "│   "
 
-        structure_string += prefix + item + "\n"
+        lines.append(prefix + item + "\n")
 
-        if os.path.isdir(item_path):
-            structure_string = display_project_structure(
-                item_path, project_root, ignored_items, new_indent, structure_string
-            )
+        if entry.is_dir():
+            _walk_project_structure(entry.path, ignored_items, new_indent, lines, tree)
 
-    return structure_string
-
-def process_file_content(file_path):
+def process_file_content(file_path, dir_entry=None):
     """
     Processes the content of a Python file, replacing sections between
     `# project_printer:ignore_start` and `# project_printer:ignore_end` with
     ...truncated code...
+    The result is cached until the file's mtime or size changes.
 
     Args:
         file_path: The path to the Python file.
+        dir_entry: The file's os.DirEntry from scandir, if known, its cached stat() result is used.
 
     Returns:
         A string containing the processed file content.
     """
-    processed_lines = []
-    in_ignore_block = False
-    ignore_replaced = False  # To avoid multiple replacements in the same block
+    cache_key = os.path.abspath(file_path)
+    try:
+        stat_result = dir_entry.stat() if dir_entry is not None else os.stat(file_path)
+    except OSError:
+        stat_result = None  # Not cached, open() below reports the error
+    else:
+        cached = _CONTENT_CACHE.get(cache_key)
+        if cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+            return cached[2]
 
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                stripped_line = line.strip()
-                if stripped_line == "# project_printer:ignore_start":
-                    in_ignore_block = True
-                    if not ignore_replaced:
-                        processed_lines.append("# truncated code\n")
-                        ignore_replaced = True
-                    continue  # Skip the ignore_start line
-                elif stripped_line == "# project_printer:ignore_end":
-                    in_ignore_block = False
-                    continue  # Skip the ignore_end line
-
-                if not in_ignore_block:
-                    processed_lines.append(line)
+        with open(file_path, "r", encoding="utf-8", buffering=READ_BUFFER_SIZE) as f:
+            content = f.read()
     except Exception as e:
         return f"# Error processing file: {e}\n"
 
-    return ''.join(processed_lines)
+    # The regex finds the marker lines, only the text between them is copied in Python
+    processed_parts = []
+    position = 0
+    in_ignore_block = False
+    ignore_replaced = False  # To avoid multiple replacements in the same block
+    for marker in _IGNORE_MARKER_RE.finditer(content):
+        if not in_ignore_block:
+            processed_parts.append(content[position:marker.start()])
+        if marker.group(1) == "start":
+            in_ignore_block = True
+            if not ignore_replaced:
+                processed_parts.append("# truncated code\n")
+                ignore_replaced = True
+        else:
+            in_ignore_block = False
+        position = marker.end()  # Skip the marker line
+    if not in_ignore_block:
+        processed_parts.append(content[position:])
+
+    processed_content = ''.join(processed_parts)
+    if stat_result is not None:
+        _CONTENT_CACHE[cache_key] = (stat_result.st_mtime_ns, stat_result.st_size, processed_content)
+    return processed_content
 
 
 def print_project_structure_and_code(project_path, ignored_items=None, output_file=None, list_of_truncated_files=None):
@@ -138,20 +243,22 @@ def print_project_structure_and_code(project_path, ignored_items=None, output_fi
     if list_of_truncated_files is None:
         list_of_truncated_files = []
 
-    basic_project_structure = display_project_structure(project_path, project_path, ignored_items=ignored_items)
+    # Scan all directories concurrently up front, both walks below then read the entries from the cache
+    tree = scan_tree(project_path, ignored_items)
+    basic_project_structure = display_project_structure(project_path, project_path, ignored_items=ignored_items, tree=tree)
     current_root_folder_name = os.path.basename(os.path.abspath(project_path))
-    print(
+    # Collect the output lines in a list and write them once at the end instead of a print() call per line
+    lines = [
         "First the basic project structure:\n========== START OF BASIC PROJECT STRUCTURE ==========\n\n"
         + current_root_folder_name
         + "\n"
         + basic_project_structure
-        + "\n\n========== END OF BASIC PROJECT STRUCTURE ==========\n\n========== START OF FULL CODE BASE ==========",
-        file=output_file,
-    )
+        + "\n\n========== END OF BASIC PROJECT STRUCTURE ==========\n\n========== START OF FULL CODE BASE ==========\n"
+    ]
 
     def process_directory(path, relative_path, level):
         """
-        Processes a directory, prints its structure, and then processes its contents.
+        Processes a directory, adds its structure to the lines, and then processes its contents.
 
         Args:
             path: The absolute path to the directory.
@@ -159,50 +266,49 @@ def print_project_structure_and_code(project_path, ignored_items=None, output_fi
             level: The depth level of the directory in the project structure.
         """
         indent = " " * 4 * level
-        print(f"{indent}📁{relative_path}", file=output_file)
+        lines.append(f"{indent}📁{relative_path}\n")
 
         try:
-            items = os.listdir(path)
+            entries = list_directory(path, ignored_items, tree)
         except PermissionError:
-            print(f"{indent}    [Permission Denied]", file=output_file)
+            lines.append(f"{indent}    [Permission Denied]\n")
             return
 
-        items = [item for item in items if item not in ignored_items and (not item.startswith(".") or item == ".gitignore" or item == ".env")]
-        items = unified_sort(items, path)
-
-        for item in items:
-            item_path = os.path.join(path, item)
+        for entry in entries:
+            item = entry.name
+            item_path = entry.path
             item_relative_path = os.path.join(relative_path, item) if relative_path else item
 
-            if os.path.isdir(item_path):
+            if entry.is_dir():
                 process_directory(item_path, item_relative_path, level + 1)
             else:
-                if (
-                    item.endswith((".py", ".md", ".html", ".css", ".js"))
-                    or item in (".gitignore", "requirements.txt", ".env")
-                ) and item not in ignored_items:
-                    print(f"{indent}└───{item_relative_path}:", file=output_file)
+                # Ignored items were already filtered out by list_directory
+                _, dot, extension = item.rpartition(".")
+                if (dot and extension in _PRINTED_EXTENSIONS) or item in _PRINTED_FILE_NAMES:
+                    lines.append(f"{indent}└───{item_relative_path}:\n")
                     try:
-                        processed_content = process_file_content(item_path)
+                        processed_content = process_file_content(item_path, entry)
                         
                         if item_relative_path not in list_of_truncated_files:
-                            print(f"{indent}    <file path='{item_relative_path}'>\n===== START OF {item_relative_path} =====", file=output_file)
-                            print(f"{indent}        ```", file=output_file)
-                            print(processed_content, end="", file=output_file)
-                            print(f"{indent}        ```", file=output_file)
-                            print(f"===== END OF {item_relative_path} =====\n{indent}    </file path='{item_relative_path}'>", file=output_file)
+                            lines.append(f"{indent}    <file path='{item_relative_path}'>\n===== START OF {item_relative_path} =====\n")
+                            lines.append(f"{indent}        ```\n")
+                            lines.append(processed_content)
+                            lines.append(f"{indent}        ```\n")
+                            lines.append(f"===== END OF {item_relative_path} =====\n{indent}    </file path='{item_relative_path}'>\n")
 
                         else:
-                            print(f"...{item_relative_path}: {processed_content.count('\n')} lines of content truncated because deemed irrelevant for the task. Use tools to read the content if necessary...", file=output_file)
+                            lines.append(f"...{item_relative_path}: {processed_content.count('\n')} lines of content truncated because deemed irrelevant for the task. Use tools to read the content if necessary...\n")
                     except Exception as e:
-                        print(f"{indent}        Error reading file: {e}", file=output_file)
-                elif item not in ignored_items:
-                    print(f"{indent}└───{item_relative_path}", file=output_file)
+                        lines.append(f"{indent}        Error reading file: {e}\n")
+                else:
+                    lines.append(f"{indent}└───{item_relative_path}\n")
 
     # Start processing from the project root
     process_directory(project_path, "", 0)
 
-    print("\n========== END OF FULL CODE BASE ==========", file=output_file)
+    lines.append("\n========== END OF FULL CODE BASE ==========\n")
+    # Like print(), write to stdout when no output file is given
+    (output_file or sys.stdout).writelines(lines)
 
 
 
@@ -214,12 +320,14 @@ def main(list_of_truncated_files: list=None):
     ]
     
 
+    # Collected in memory, so it's written to 'project.txt' in one go and doesn't have to be read back
+    output = io.StringIO()
+    print_project_structure_and_code(project_root, ignore_list, output, list_of_truncated_files=list_of_truncated_files)
+    project_content = output.getvalue()
+
     # Open 'project.txt' in write mode to overwrite existing content
     with open("temp/project.txt", "w", encoding="utf-8") as f:
-        print_project_structure_and_code(project_root, ignore_list, f, list_of_truncated_files=list_of_truncated_files)
-    
-    with open("temp/project.txt", "r", encoding="utf-8") as f:
-        project_content = f.read()
+        f.write(project_content)
     return project_content
     
 
@@ -0,0 +1,16 @@
+import pytest
+from flask import Flask
+
+from models import db, init_db
+
+
+@pytest.fixture
+def db_app():
+    """App on a fresh in-memory SQLite database, set up by init_db like the real one (pragmas, tables)."""
+    test_app = Flask(__name__)
+    test_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    test_app.config['TESTING'] = True
+    init_db(test_app)
+    with test_app.app_context():
+        yield test_app
+        db.session.remove()
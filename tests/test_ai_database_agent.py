@@ -0,0 +1,34 @@
+import os
+
+from AI_database_agent import send_csv_file
+
+COLUMNS = [{"header": "Email", "field": "email"}]
+
+
+def test_send_csv_file_rejects_non_numeric_ids(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    result = send_csv_file(COLUMNS, ["1", "lead-2"], selected_lead_ids={1, 2})
+
+    assert result.startswith("Export failed")
+    assert not os.path.exists("output")
+
+
+def test_send_csv_file_rejects_leads_that_are_not_selected(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    result = send_csv_file(COLUMNS, ["1", "3"], selected_lead_ids={1, 2})
+
+    assert result == "Export failed, only the selected Leads can be exported. Not selected: [3]"
+
+
+def test_send_csv_file_stores_int_ids(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+
+    result = send_csv_file(COLUMNS, ["2", "1"], selected_lead_ids={1, 2})
+
+    [definition] = os.listdir("output")
+    assert definition.removesuffix(".json") in result
+    with open(os.path.join("output", definition)) as f:
+        assert f.read() == '{"columns": [{"header": "Email", "field": "email"}], "lead_ids": [2, 1]}'
@@ -0,0 +1,129 @@
+import inspect
+import json
+
+from main import delete_batch, get_batch_manager_page
+from models import db, Company, StructuredLead, ProcessingTask, LeadTag
+
+
+def add_company(name, **fields):
+    company = Company(name=name, website_url=f"https://{name.lower()}.com", niche_category='Dentists', **fields)
+    db.session.add(company)
+    db.session.flush()
+    return company
+
+
+def add_lead(name, company, tags):
+    lead = StructuredLead(first_name=name, last_name='Doe', email=f"{name.lower()}@example.com", company_id=company.id, tags=tags)
+    db.session.add(lead)
+    db.session.flush()
+    return lead
+
+
+def add_task(status, company=None, lead=None, error=None):
+    task = ProcessingTask(
+        task_type='video_render', status=status,
+        company_id=company.id if company else None, structured_lead_id=lead.id if lead else None,
+        result_data=json.dumps({'error': error}) if error else None,
+    )
+    db.session.add(task)
+    db.session.flush()
+    return task
+
+
+def test_batch_manager_aggregates(db_app):
+    done = add_company('Done', custom_youtube_video='https://youtu.be/done')
+    failed = add_company('Failed')
+    running = add_company('Running')
+    add_task('completed', company=done)
+    add_task('failed', company=failed, error='Render crashed')
+    add_task('failed', company=failed, error='Render crashed')
+    add_task('pending', company=failed)
+    add_task('in_progress', company=running)
+    for company in (done, failed, running):
+        add_lead(company.name, company, 'import-batch 01-02-2025/0')
+    add_lead('Other', add_company('Other'), 'import-batch 02-02-2025/0, vip')
+    db.session.commit()
+
+    batch_info_list, pagination = get_batch_manager_page(1)
+
+    assert [info['batch_tag'] for info in batch_info_list] == ['import-batch 02-02-2025/0', 'import-batch 01-02-2025/0']
+    assert pagination['total_batches'] == 2
+    assert pagination['total_pages'] == 1
+    batch = batch_info_list[1]
+    assert batch['total_leads'] == 3
+    assert batch['done_count'] == 1
+    # Two failed tasks of one company's lead count as one failed lead, with one message
+    assert batch['failed_count'] == 1
+    assert batch['error_messages'] == ['Company: Failed - Render crashed']
+    assert batch['progress_percent'] == 33
+    assert batch['failed_percent'] == 33
+    assert batch_info_list[0]['total_leads'] == 1
+    assert batch_info_list[0]['done_count'] == 0
+    assert batch_info_list[0]['error_messages'] == []
+
+
+def test_batch_manager_sorts_by_date_and_number(db_app):
+    tags = ['import-batch 01-01-2025/2', 'import-batch 31-12-2024/5', 'import-batch 01-01-2025/10', 'manual']
+    for index, tag in enumerate(tags):
+        add_lead(f"Lead{index}", add_company(f"Company{index}"), tag)
+    db.session.commit()
+
+    batch_info_list, pagination = get_batch_manager_page(1)
+
+    assert [info['batch_tag'] for info in batch_info_list] == [
+        'import-batch 01-01-2025/10', 'import-batch 01-01-2025/2', 'import-batch 31-12-2024/5',
+    ]
+
+
+def test_batch_manager_clamps_page(db_app):
+    for index in range(12):
+        add_lead(f"Lead{index}", add_company(f"Company{index}"), f"import-batch 01-01-2025/{index}")
+    db.session.commit()
+
+    batch_info_list, pagination = get_batch_manager_page(5)
+
+    assert pagination['page'] == 2
+    assert pagination['total_pages'] == 2
+    assert [info['batch_tag'] for info in batch_info_list] == ['import-batch 01-01-2025/1', 'import-batch 01-01-2025/0']
+
+
+def call_delete_batch(db_app, batch_tag):
+    # The view without its login and role checks
+    with db_app.test_request_context(json={'batch_tag': batch_tag}):
+        response = inspect.unwrap(delete_batch)()
+    response, status = response if isinstance(response, tuple) else (response, 200)
+    return response.get_json(), status
+
+
+def test_delete_batch_cascades(db_app):
+    shared = add_company('Shared')
+    own = add_company('Own')
+    deleted_lead = add_lead('Deleted', shared, 'import-batch 01-01-2025/0')
+    own_lead = add_lead('Owned', own, 'import-batch 01-01-2025/0')
+    kept_lead = add_lead('Kept', shared, 'import-batch 02-01-2025/0')
+    shared_task = add_task('completed', company=shared)
+    add_task('failed', company=own, error='Render crashed')
+    add_task('pending', lead=deleted_lead)
+    kept_lead_task = add_task('pending', lead=kept_lead)
+    db.session.commit()
+    deleted_lead_ids = [deleted_lead.id, own_lead.id]
+
+    body, status = call_delete_batch(db_app, 'import-batch 01-01-2025/0')
+
+    assert status == 200
+    assert body['message'] == "Successfully deleted 2 leads and 1 companies for batch 'import-batch 01-01-2025/0'"
+    assert db.session.scalars(db.select(StructuredLead.id)).all() == [kept_lead.id]
+    # The company that still has a lead is kept with its tasks, the other one goes with its tasks
+    assert db.session.scalars(db.select(Company.id)).all() == [shared.id]
+    assert sorted(db.session.scalars(db.select(ProcessingTask.id))) == [shared_task.id, kept_lead_task.id]
+    assert not db.session.scalars(db.select(LeadTag).where(LeadTag.lead_id.in_(deleted_lead_ids))).all()
+
+
+def test_delete_batch_unknown_tag(db_app):
+    add_lead('Kept', add_company('Kept'), 'import-batch 01-01-2025/0')
+    db.session.commit()
+
+    body, status = call_delete_batch(db_app, 'import-batch 02-01-2025/0')
+
+    assert status == 404
+    assert db.session.scalar(db.select(db.func.count(StructuredLead.id))) == 1
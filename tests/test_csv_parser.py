@@ -0,0 +1,127 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from csv_parser import save_import_batch_async
+from models import db, Company, StructuredLead
+
+BATCH_TAG = 'import-batch 01-01-2025/0'
+
+
+def make_row(website_url, first_name, email=None):
+    company = Company(name=f"{first_name} Inc", website_url=website_url, niche_category='Dentists')
+    lead = StructuredLead(first_name=first_name, last_name='Doe', email=email or f"{first_name.lower()}@example.com")
+    return {}, company, lead
+
+
+def save_batches(*batches):
+    company_ids_by_url, seen_leads = {}, set()
+    results = [
+        asyncio.run(save_import_batch_async(batch, BATCH_TAG, company_ids_by_url, seen_leads))
+        for batch in batches
+    ]
+    db.session.commit()
+    return results
+
+
+@pytest.fixture
+def gemini():
+    with patch('models.run_prompt_with_gemini_async', new_callable=AsyncMock) as mock:
+        mock.return_value = '{"same_company": true, "confidence": 0.9, "reason": "Same name"}'
+        yield mock
+
+
+def test_same_urls_are_one_company(db_app, gemini):
+    existing = Company(name='Existing', website_url='https://acme.com', niche_category='Dentists')
+    db.session.add(existing)
+    db.session.commit()
+
+    (company_ids, skipped), (next_company_ids, _) = save_batches(
+        [make_row('https://acme.com', 'Ann'), make_row('https://bar.com', 'Bob'), make_row('https://bar.com', 'Cid')],
+        [make_row('https://acme.com', 'Dan'), make_row('https://bar.com', 'Eve')],
+    )
+
+    assert company_ids[0] == existing.id
+    assert company_ids[1] == company_ids[2] != existing.id
+    assert next_company_ids == [existing.id, company_ids[1]]
+    assert skipped == 0
+    assert db.session.scalar(db.select(db.func.count(Company.id))) == 2
+    assert db.session.scalar(db.select(db.func.count(StructuredLead.id))) == 5
+    gemini.assert_not_called()
+
+
+def test_normalized_urls_are_one_company(db_app, gemini):
+    existing = Company(name='Existing', website_url='https://www.acme.com/', niche_category='Dentists')
+    db.session.add(existing)
+    db.session.commit()
+
+    (company_ids, _), (next_company_ids, _) = save_batches(
+        [make_row('acme.com', 'Ann'), make_row('http://acme.com', 'Bob'), make_row('https://bar.com', 'Cid')],
+        [make_row('https://www.ACME.com', 'Dan'), make_row('bar.com/', 'Eve')],
+    )
+
+    assert company_ids[:2] == [existing.id, existing.id]
+    assert next_company_ids == [existing.id, company_ids[2]]
+    assert db.session.scalar(db.select(db.func.count(Company.id))) == 2
+    gemini.assert_not_called()
+
+
+def test_same_host_different_pages_stay_apart(db_app, gemini):
+    (company_ids, _), (next_company_ids, _) = save_batches(
+        [make_row('https://facebook.com/companyA', 'Ann'), make_row('https://facebook.com/companyB', 'Bob')],
+        [make_row('https://facebook.com/companyC', 'Cid'), make_row('https://facebook.com/companyA', 'Dan')],
+    )
+
+    assert len(set(company_ids)) == 2
+    assert next_company_ids[1] == company_ids[0]
+    assert next_company_ids[0] not in company_ids
+    assert db.session.scalar(db.select(db.func.count(Company.id))) == 3
+    gemini.assert_not_called()
+
+
+def test_base_url_match_confirmed_by_gemini(db_app, gemini):
+    existing = Company(name='Acme', website_url='acme.com', niche_category='Dentists')
+    db.session.add(existing)
+    db.session.commit()
+
+    [(company_ids, _)] = save_batches([make_row('https://acme.com/dentists', 'Ann')])
+
+    assert company_ids == [existing.id]
+    assert db.session.scalar(db.select(db.func.count(Company.id))) == 1
+    gemini.assert_awaited_once()
+
+
+def test_failed_duplicate_check_saves_new_company(db_app, gemini):
+    existing = Company(name='Acme', website_url='acme.com', niche_category='Dentists')
+    db.session.add(existing)
+    db.session.commit()
+    gemini.side_effect = RuntimeError('Gemini unavailable')
+
+    [(company_ids, _)] = save_batches([make_row('https://acme.com/dentists', 'Ann')])
+
+    assert company_ids[0] != existing.id
+    assert db.session.scalar(db.select(db.func.count(Company.id))) == 2
+
+
+def test_duplicate_leads_are_skipped(db_app, gemini):
+    existing = Company(name='Acme', website_url='https://acme.com', niche_category='Dentists')
+    db.session.add(existing)
+    db.session.flush()
+    db.session.add(StructuredLead(first_name='Ann', last_name='Doe', email='ann@example.com', company_id=existing.id))
+    db.session.commit()
+
+    (company_ids, skipped), (_, next_skipped) = save_batches(
+        # Same email as the existing lead, same name as the other lead in the batch, and a new lead
+        [make_row('https://acme.com', 'Other', email='ANN@example.com'), make_row('https://bar.com', 'Bob'),
+         make_row('https://baz.com', 'Bob', email='bob2@example.com')],
+        # Same email as a lead of the previous batch
+        [make_row('https://qux.com', 'Eve', email='bob@example.com')],
+    )
+
+    assert len(company_ids) == 3
+    assert skipped == 2
+    assert next_skipped == 1
+    assert db.session.scalars(db.select(StructuredLead.email).order_by(StructuredLead.id)).all() == [
+        'ann@example.com', 'bob@example.com',
+    ]
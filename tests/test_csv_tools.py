@@ -356,3 +356,18 @@ def test_convert_and_store_data_edge_cases(setup_db, tmp_path, sample_field_defi
             assert lead1_data["employees"] == "0"  # Zero value
             assert lead2_data["niche_category"] == "Special & Characters"  # Special characters
             assert lead2_data["employees"] == "-1"  # Negative value
+
+def test_csv_to_json_iter_yields_rows_lazily(tmp_path):
+    csv_path = tmp_path / "leads.csv"
+    csv_path.write_text("Name,Website\nJohn Doe,https://example.com\n , \n,\nJane Roe,\n", encoding='utf-8')
+
+    rows = utils.csv_tools.csv_to_json_iter(str(csv_path))
+
+    assert not isinstance(rows, list)
+    assert next(rows) == {"Name": "John Doe", "Website": "https://example.com"}
+    # Rows with only blank values are skipped
+    assert list(rows) == [{"Name": "Jane Roe", "Website": ""}]
+    assert utils.csv_tools.csv_to_json_list(str(csv_path)) == [
+        {"Name": "John Doe", "Website": "https://example.com"},
+        {"Name": "Jane Roe", "Website": ""},
+    ]
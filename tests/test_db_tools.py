@@ -0,0 +1,35 @@
+import threading
+from sqlalchemy import create_engine, text
+from utils.db_tools import chunked, count_queries
+
+
+def test_count_queries_counts_statements_inside_block():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with count_queries(engine) as queries:
+            conn.execute(text("SELECT 2"))
+            conn.execute(text("SELECT 3"))
+        conn.execute(text("SELECT 4"))
+
+    assert queries == ["SELECT 2", "SELECT 3"]
+
+
+def test_count_queries_ignores_other_threads():
+    engine = create_engine("sqlite://")
+
+    def run_query():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    with count_queries(engine) as queries:
+        thread = threading.Thread(target=run_query)
+        thread.start()
+        thread.join()
+
+    assert queries == []
+
+
+def test_chunked_splits_into_lists_of_at_most_size():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked(iter([]), 2)) == []
@@ -1,6 +1,8 @@
 import unittest
+from unittest.mock import patch
+import main
 from main import app
-from models import db, Lead, LeadData, FieldDefinition, ProcessingTask
+from models import db, Lead, LeadData, FieldDefinition, ProcessingTask, Company, StructuredLead
 
 class TestLeadsOverview(unittest.TestCase):
 
@@ -104,5 +106,23 @@ class TestLeadsOverview(unittest.TestCase):
     # Method: Click on the same column header twice and observe the table's sorting behavior. (Manual Test)
     # Passing Criteria: Clicking the same header again should reverse the sort order (ascending/descending).
 
+def test_leads_overview_selects_only_shown_columns(db_app):
+    company = Company(name='Acme', website_url='https://acme.com', niche_category='Dentists')
+    db.session.add(company)
+    db.session.flush()
+    db.session.add(StructuredLead(first_name='Ann', last_name='Doe', email='ann@example.com', company_id=company.id))
+    db.session.commit()
+
+    with db_app.test_request_context('/leads_overview'), patch('main.render_template') as render_template:
+        main.leads_overview()
+
+    [lead] = render_template.call_args.kwargs['leads_data']
+    assert set(lead) == {
+        'id', 'company_id', 'created_at', 'first_name', 'last_name', 'email', 'phone', 'linkedin_url', 'tags',
+        'company_name', 'company_website_url', 'company_niche_category', 'company_is_running_ads',
+        'company_custom_youtube_video', 'company_ads_url', 'company_tags', 'task_status', 'task_updated_at',
+    }
+    assert (lead['company_id'], lead['company_name'], lead['email']) == (company.id, 'Acme', 'ann@example.com')
+
 if __name__ == '__main__':
     unittest.main()
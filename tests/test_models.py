@@ -0,0 +1,29 @@
+from models import db, Lead, LeadData
+
+
+def test_lead_data_upsert_overwrites_fields(db_app):
+    lead = Lead(source='csv_import')
+    other_lead = Lead(source='csv_import')
+    db.session.add_all([lead, other_lead])
+    db.session.flush()
+
+    LeadData.upsert([
+        {'lead_id': lead.id, 'field_name': 'email', 'field_value': 'old@example.com'},
+        {'lead_id': lead.id, 'field_name': 'phone', 'field_value': '123'},
+        {'lead_id': other_lead.id, 'field_name': 'email', 'field_value': 'other@example.com'},
+    ])
+    LeadData.upsert([
+        {'lead_id': lead.id, 'field_name': 'email', 'field_value': 'new@example.com',
+         'is_enriched': True, 'enrichment_source': 'hunter'},
+    ])
+    db.session.commit()
+
+    rows = db.session.execute(
+        db.select(LeadData.lead_id, LeadData.field_name, LeadData.field_value, LeadData.is_enriched, LeadData.enrichment_source)
+        .order_by(LeadData.lead_id, LeadData.field_name)
+    ).all()
+    assert [tuple(row) for row in rows] == [
+        (lead.id, 'email', 'new@example.com', True, 'hunter'),
+        (lead.id, 'phone', '123', False, None),
+        (other_lead.id, 'email', 'other@example.com', False, None),
+    ]
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+import pytest
+
+from models import db, utc_now, Company, ProcessingTask
+from Task_worker import get_next_task
+
+
+@pytest.fixture
+def company(db_app):
+    company = Company(name='Acme', website_url='https://acme.com', niche_category='Dentists')
+    db.session.add(company)
+    db.session.commit()
+    return company
+
+
+def add_task(company, task_type, status='pending', updated_at=None):
+    task = ProcessingTask(task_type=task_type, status=status, company_id=company.id)
+    if updated_at:
+        task.updated_at = updated_at
+    db.session.add(task)
+    db.session.commit()
+    return task.id
+
+
+def test_get_next_task_claims_by_priority(company):
+    email_find = add_task(company, 'email_find')
+    video_render = add_task(company, 'video_render')
+    upload_video = add_task(company, 'upload_video')
+    add_task(company, 'video_render', status='completed')
+
+    claimed = [get_next_task(db.session, 'worker-1') for _ in range(4)]
+
+    assert [task.id if task else None for task in claimed[:3]] == [upload_video, video_render, email_find]
+    assert claimed[3] is None
+    db.session.expire_all()
+    task = db.session.get(ProcessingTask, upload_video)
+    assert (task.status, task.instance_id) == ('in_progress', 'worker-1')
+
+
+def test_get_next_task_reclaims_stuck_tasks(company):
+    add_task(company, 'video_render', status='in_progress', updated_at=utc_now() - timedelta(minutes=10))
+    stuck = add_task(company, 'video_render', status='in_progress', updated_at=utc_now() - timedelta(hours=2))
+
+    task = get_next_task(db.session, 'worker-2')
+
+    assert task.id == stuck
+    assert task.instance_id == 'worker-2'
+    assert get_next_task(db.session, 'worker-3') is None
+
+
+def test_get_next_task_filters_task_types(company):
+    add_task(company, 'upload_video')
+    video_render = add_task(company, 'video_render')
+
+    task = get_next_task(db.session, 'render-worker', task_types=['video_render'])
+
+    assert task.id == video_render
+    assert get_next_task(db.session, 'render-worker', task_types=['video_render']) is None
@@ -2,10 +2,18 @@ import aisuite
 import google.generativeai as genai
 import os
 import asyncio
+import time
 from google import genai as new_genai
+from google.genai import types as genai_types
 
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
+# Lifetime of the Gemini context caches of static prompt prefixes
+PROMPT_CACHE_TTL = 3600  # seconds
+
+# Context cache name (or None if caching the prefix failed) and its expiry time, by (model, prefix)
+_prompt_caches = {}
+
 
 def ask_question_and_get_boolean_answer(question: str, provider_model: str="openai:gpt-4o") -> bool:
     """
@@ -187,3 +195,59 @@ async def run_prompt_with_gemini_async(prompt, model="gemini-2.0-flash"):
                     raise  # Re-raise the last exception after all retries fail
 
     return None  # Should not reach here as exception is re-raised, but for clarity
+
+async def _get_prompt_cache_async(client, model, prefix):
+    """
+    Returns the name of a Gemini context cache holding the prefix, creating it when missing or expired.
+    Returns None if the prefix can't be cached (e.g. it is below the model's minimum cache size);
+    that is remembered for PROMPT_CACHE_TTL too, so failing uploads don't retry on every call.
+    Concurrent callers may both create a cache, the extra one expires on its own.
+    """
+    cache_name, expires_at = _prompt_caches.get((model, prefix), (None, 0))
+    # Renew a minute early so the cache doesn't expire during a request
+    if time.monotonic() < expires_at - 60:
+        return cache_name
+    try:
+        cache = await client.aio.caches.create(
+            model=model,
+            config=genai_types.CreateCachedContentConfig(contents=[prefix], ttl=f"{PROMPT_CACHE_TTL}s")
+        )
+        cache_name = cache.name
+    except Exception as e:
+        print(f"Could not create Gemini context cache, sending the full prompt: {e}")
+        cache_name = None
+    _prompt_caches[(model, prefix)] = (cache_name, time.monotonic() + PROMPT_CACHE_TTL)
+    return cache_name
+
+async def run_prompt_with_gemini_cached_async(prefix, prompt, model="gemini-2.0-flash-001"):
+    """
+    Runs a prompt whose static prefix is stored in a Gemini context cache, so only the
+    variable part is sent (and billed as new input) per call.
+    Falls back to sending prefix + prompt when the prefix can't be cached.
+
+    Args:
+        prefix (str): The static start of the prompt, the same for every call.
+        prompt (str): The variable rest of the prompt.
+        model (str, optional): The Gemini model to use, caching needs a versioned model.
+            Defaults to "gemini-2.0-flash-001".
+
+    Returns:
+        str: The content of the response from the Gemini API.
+    """
+    client = new_genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    cache_name = await _get_prompt_cache_async(client, model, prefix)
+    if cache_name is None:
+        return await run_prompt_with_gemini_async(prefix + prompt, model=model)
+
+    try:
+        response = await client.aio.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=genai_types.GenerateContentConfig(cached_content=cache_name)
+        )
+        return response.text
+    except Exception as e:
+        # The cache may have been evicted, create a new one next time and send the full prompt now
+        print(f"Gemini API cached call failed, retrying without the cache: {e}")
+        _prompt_caches.pop((model, prefix), None)
+        return await run_prompt_with_gemini_async(prefix + prompt, model=model)
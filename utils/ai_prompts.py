@@ -147,6 +147,77 @@ def create_prompt_for_csv_tools_test() -> str:
           """
     return prompt
 
+def create_prompt_for_csv_check_instructions() -> str:
+    """
+    Generates the static instructions of the CSV completeness check.
+    They don't depend on the file, so they can be cached by the AI provider and sent once.
+    The response ends with 'ALL_GOOD' or 'MISSING_INFO: <explanation>'.
+
+    Returns:
+        The generated instructions, to be followed by create_prompt_for_csv_check.
+    """
+    return """
+You are a helpful assistant that analyzes a CSV file to determine if all the necessary information is present.
+The CSV file is for a list of Leads+Companies.
+
+Each actual entry has to have the information about first name, email, company name, website url and niche or something (like 'BC blue collar', 'coaching' or whatever).
+This is just a safety check to make sure the CSV file is not missing any important information.
+It is very likely that all the information is present, but we want to be sure.
+Other information is not important and can be missing. We just need the basic information (first name, email, company name, website url and niche or something).
+
+If any of this information is missing, you should return write 'MISSING_INFO: explanaition of what is missing' at the end of your response. If no information is missing, return 'ALL_GOOD' at the end.
+So now alanlyse critically the csv and write if the information is missing for any Lead. Please explain what is missing if something is missing in understandable form.
+Example 1:
+Input:
+```csv
+First Name, Last Name, Email, Company Name, Website URL, Type
+John, Doe, john.doe@example.com, Example Inc, https://example.com,na
+Jane, Smith,, Example Corp, https://example.com, "coaching"
+```
+Output:
+```
+Okay, I will analyze the CSV data to check for missing information in the required fields: FirstName, email, CompanyName, Website Link, and Niche.
+Here's the analysis:
+* **John Doe** has missing type/niche
+* **Jane Smith** has missing email
+
+Example 2:
+Input:
+```csv
+First Name, Last Name, Email, Company Name, Website URL, Type, Phone, LinkedIn URL
+Justin, D., justin.doe@example.com, Example Inc, https://example.com, "bc", na, na
+Fleur,, fleur.smith@example.com, Example Corp, https://example.com, "construction", na, na
+```
+Output:
+```
+Okay, I will analyze the CSV data to check for missing information in the required fields: FirstName, email, CompanyName, Website Link, and Niche.
+Here's the analysis:
+* **Justin D.** has all basic information
+* **Fleur** has all basic information
+
+Conslusion:
+ALL_GOOD
+```
+
+Now it's your turn.
+"""
+
+def create_prompt_for_csv_check(csv_text: str) -> str:
+    """
+    Generates the file specific part of the CSV completeness check prompt.
+
+    Args:
+        csv_text: The content of the CSV file.
+
+    Returns:
+        The generated prompt, to be sent after create_prompt_for_csv_check_instructions.
+    """
+    return f"""```csv
+{csv_text}
+```
+So now alanlyse critically the csv and write if the information is missing for any Lead. Please explain what is missing if something is missing .
+"""
+
 def create_prompt_for_loading_data(input: str, output_rules: str) -> str:
     return f"""Your job is to extract the available Leads information into a uniform format into a json. As part of this you can and should format the data.
 
@@ -4,7 +4,9 @@ import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 from models import db, FieldDefinition, Lead, LeadData
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
+from functools import lru_cache
+from sqlalchemy import event
 import datetime
 import aisuite
 
@@ -12,27 +14,44 @@ from utils.ai_prompts import create_prompt_for_column_mapping
 load_dotenv(override=True)
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-def csv_to_json_list(input_csv_path: str) -> list[dict]:
+def csv_to_json_iter(input_csv_path: str) -> Iterator[dict]:
     """
-    Reads a CSV file, converts each line to a JSON object, and returns a list of these objects.
-    Removes lines where all values are empty strings.
+    Reads a CSV file line by line and yields each line as a JSON object.
+    Skips lines where all values are empty strings.
 
     Args:
         input_csv_path: The path to the input CSV file.
 
     Returns:
-        A list of dictionaries, where each dictionary represents a line in the CSV.
+        An iterator of dictionaries, where each dictionary represents a line in the CSV.
     """
-    json_list = []
     with open(input_csv_path, 'r', encoding='utf-8') as csv_file:
         reader = csv.DictReader(csv_file)
         for row in reader:
             if any(value.strip() for value in row.values()):
-                json_list.append(row)
-    return json_list
+                yield row
+
+def csv_to_json_list(input_csv_path: str) -> list[dict]:
+    """
+    Reads a CSV file, converts each line to a JSON object, and returns a list of these objects.
+    Removes lines where all values are empty strings.
+
+    Args:
+        input_csv_path: The path to the input CSV file.
+
+    Returns:
+        A list of dictionaries, where each dictionary represents a line in the CSV.
+    """
+    return list(csv_to_json_iter(input_csv_path))
 
+@lru_cache(maxsize=1)
 def get_field_definitions() -> List[Dict[str, Any]]:
-    """Get all field definitions from the database."""
+    """
+    Get all field definitions from the database.
+
+    The result is cached. ORM writes to FieldDefinition clear the cache, call
+    `get_field_definitions.cache_clear()` after changing field definitions any other way.
+    """
     fields = FieldDefinition.query.all()
     return [{
         'name': field.name,
@@ -42,6 +61,13 @@ def get_field_definitions() -> List[Dict[str, Any]]:
         'required': field.is_required
     } for field in fields]
 
+@event.listens_for(FieldDefinition, 'after_insert')
+@event.listens_for(FieldDefinition, 'after_update')
+@event.listens_for(FieldDefinition, 'after_delete')
+def _clear_field_definitions_cache(mapper, connection, target):
+    """Drops the cached field definitions whenever the ORM writes a FieldDefinition."""
+    get_field_definitions.cache_clear()
+
 def ai_map_columns(input_csv_path: str, fields: List[Dict[str, Any]]) -> Dict[str, Optional[Dict]]:
     """
     Maps input CSV columns to output columns, handling direct matches and name splitting.
@@ -0,0 +1,58 @@
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from sqlalchemy import event
+
+# Maximum number of values bound in one IN (...) clause, keeps statements below the database's parameter limits
+# (999 bound parameters per statement for SQLite before 3.32) with room for the statement's other parameters
+IN_CLAUSE_CHUNK_SIZE = 900
+
+def chunked(values, size=IN_CLAUSE_CHUNK_SIZE):
+    """
+    Splits values into lists of at most size items, e.g. for IN (...) clauses over many ids.
+
+    Usage:
+        for ids in chunked(lead_ids):
+            db.session.execute(delete(ProcessingTask).where(ProcessingTask.structured_lead_id.in_(ids)))
+
+    Args:
+        values: Any iterable
+        size: Maximum length of a chunk
+
+    Yields:
+        list: The next chunk
+    """
+    iterator = iter(values)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+@contextmanager
+def count_queries(engine):
+    """
+    Records the SQL statements the current thread executes on the engine inside the block.
+    Used to log how many queries a code path makes, so N+1 regressions show up.
+
+    Usage:
+        with count_queries(db.engine) as queries:
+            ...
+        logger.info(f"Made {len(queries)} queries")
+
+    Args:
+        engine: The SQLAlchemy engine (or connection) to listen on
+
+    Yields:
+        list[str]: The executed statements, filled while the block runs
+    """
+    queries = []
+    thread_id = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Other threads (requests, workers) share the engine, only count our own statements
+        if threading.get_ident() == thread_id:
+            queries.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -148,7 +148,7 @@ def render_video(config_dict: dict, output_path: str):
     final_video = concatenate_videoclips(clips)
 
     final_video.write_videofile(
-        output_path, fps=24, codec="libx264", threads=1
+        output_path, fps=24, codec=config.render_codec, threads=config.render_threads
     )
 
 